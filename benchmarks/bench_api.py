@@ -0,0 +1,120 @@
+"""Load test the coffee shop and capstone APIs with locally minted tokens.
+
+Start the app with the local issuer switched on, so it accepts tokens from
+fsnd_common.local_issuer and never calls Auth0:
+
+    export AUTH_ISSUER=local
+    flask run                                  # in the app's directory
+
+then send a fixed request rate at its authenticated listings:
+
+    python benchmarks/bench_api.py coffee --rate 200 --duration 30
+    python benchmarks/bench_api.py capstone --base-url http://127.0.0.1:8080
+
+Requests are sent open loop: each is due at a fixed time whether or not
+earlier ones have returned, and its latency is counted from when it was
+due, so a stalled server shows up as latency instead of a lower rate.
+"""
+import argparse
+import queue
+import threading
+import time
+from collections import Counter
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from fsnd_common.local_issuer import LocalIssuer
+
+# app: (audience, [(path, permission)])
+TARGETS = {
+    'coffee': ('localhost:5000', [('/drinks-detail', 'get:drinks_detail')]),
+    'capstone': ('localhost:5000', [('/actors', 'get:actors'),
+                                    ('/movies', 'get:movies')]),
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(base_url, audience, paths, rate, duration, concurrency):
+    issuer = LocalIssuer.load_or_create()
+    token = issuer.mint(audience, [permission for path, permission in paths])
+    headers = {'Authorization': 'Bearer ' + token}
+    due = queue.Queue()
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = due.get()
+            if item is None:
+                return
+            at, path = item
+            delay = at - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                with urlopen(Request(base_url + path, headers=headers),
+                             timeout=30) as response:
+                    response.read()
+                    status = response.status
+            except HTTPError as e:
+                status = e.code
+            except URLError:
+                status = 'error'
+            with lock:
+                latencies.append(time.time() - at)
+                statuses[status] += 1
+
+    threads = [threading.Thread(target=worker, daemon=True)
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    started = time.time() + 0.1
+    total = int(rate * duration)
+    for number in range(total):
+        due.put((started + number / float(rate),
+                 paths[number % len(paths)][0]))
+    for _ in threads:
+        due.put(None)
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+    latencies.sort()
+    return {'requests': total,
+            'achieved_rate': total / elapsed,
+            'statuses': dict(statuses),
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p90_ms': percentile(latencies, 0.90) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'max_ms': (latencies[-1] if latencies else 0.0) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('app', choices=sorted(TARGETS))
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--rate', type=float, default=100,
+                        help='requests per second')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='seconds')
+    parser.add_argument('--concurrency', type=int, default=32,
+                        help='requests in flight at most')
+    args = parser.parse_args()
+    audience, paths = TARGETS[args.app]
+    result = run(args.base_url.rstrip('/'), audience, paths, args.rate,
+                 args.duration, args.concurrency)
+    print('{} requests to {} at {:.0f}/s (target {:.0f}/s)'.format(
+        result['requests'], ', '.join(path for path, _ in paths),
+        result['achieved_rate'], args.rate))
+    print('statuses: {}'.format(result['statuses']))
+    print('latency ms: p50 {p50_ms:.1f}  p90 {p90_ms:.1f}  p99 {p99_ms:.1f}'
+          '  max {max_ms:.1f}'.format(**result))
+
+
+if __name__ == '__main__':
+    main()
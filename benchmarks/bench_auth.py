@@ -0,0 +1,35 @@
+"""Per-request bearer token verification cost, with and without the
+verified-token cache.
+
+Mints a token with the local issuer (fsnd_common.local_issuer), whose JWKS
+is a local file, then times Auth.verify_decode_jwt, the per-request check
+of every app, once with the default cache and once with a cache that keeps
+nothing; no network or database needed:
+
+    pip install -e .[auth]
+    python benchmarks/bench_auth.py
+"""
+import timeit
+
+from fsnd_common.auth import Auth
+from fsnd_common.local_issuer import LocalIssuer
+from fsnd_common.token_cache import VerifiedTokenCache
+
+AUDIENCE = 'bench'
+REQUESTS = 2000
+
+
+if __name__ == '__main__':
+    issuer = LocalIssuer.load_or_create()
+    token = issuer.mint(AUDIENCE, ['get:drinks_detail', 'get:actors'])
+    jwks = issuer.key_store(background=False)
+    print('{:>12}  {:>16}'.format('', 'us per request'))
+    # maxsize=0 evicts every payload as soon as it is stored
+    for name, cache in (('no cache', VerifiedTokenCache(maxsize=0)),
+                        ('cache', VerifiedTokenCache())):
+        auth = Auth('unused', AUDIENCE, issuer=issuer.issuer, jwks=jwks,
+                    token_cache=cache)
+        auth.verify_decode_jwt(token)
+        seconds = timeit.timeit(lambda: auth.verify_decode_jwt(token),
+                                number=REQUESTS)
+        print('{:>12}  {:>16.1f}'.format(name, seconds / REQUESTS * 1e6))
@@ -0,0 +1,6 @@
+'''
+fsnd_common
+    code shared by the Flask apps in this repository. Each app installs it
+    from its requirements.txt with an editable path back to the repository
+    root.
+'''
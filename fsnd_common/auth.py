@@ -0,0 +1,207 @@
+'''
+Bearer token authentication shared by the coffee shop, capstone and
+BasicFlaskAuth apps.
+
+Each app builds one Auth for its issuer and audience in its auth module:
+
+    auth = Auth(AUTH0_DOMAIN, API_AUDIENCE)
+    requires_auth = auth.requires_auth
+
+    @app.route('/drinks-detail')
+    @requires_auth('get:drinks-detail')
+    def get_drinks_detail(payload):
+        ...
+
+Verified tokens are cached until they expire (fsnd_common.token_cache) and
+the signing keys are kept by a JWKSKeyStore (fsnd_common.jwks). The payload
+handed to views is a VerifiedPayload, whose permissions frozenset is built
+once per token, so permission checks are set lookups.
+
+With AUTH_ISSUER=local in the environment, Auth accepts tokens minted by
+fsnd_common.local_issuer instead of the configured domain's, for load tests
+and offline work.
+'''
+import os
+from functools import wraps
+
+from flask import request
+from jose import jwt
+
+from .jwks import JWKSKeyStore
+from .local_issuer import LocalIssuer
+from .token_cache import VerifiedTokenCache
+
+ALGORITHMS = ['RS256']
+
+
+class AuthError(Exception):
+    '''
+    AuthError Exception
+        A standardized way to communicate auth failure modes
+    '''
+    def __init__(self, error, status_code):
+        self.error = error
+        self.status_code = status_code
+
+
+class VerifiedPayload(dict):
+    '''
+    VerifiedPayload
+        the claims of a verified token, plus its permissions claim as a
+        frozenset
+    '''
+    def __init__(self, claims):
+        super(VerifiedPayload, self).__init__(claims)
+        permissions = claims.get('permissions')
+        self.has_permissions = isinstance(permissions, (list, tuple))
+        self.permissions = frozenset(permissions or ())
+
+
+class Auth(object):
+    def __init__(self, domain, audience, algorithms=ALGORITHMS, issuer=None,
+                 jwks=None, token_cache=None):
+        if os.environ.get('AUTH_ISSUER') == 'local' and jwks is None:
+            local_issuer = LocalIssuer.load_or_create()
+            issuer = local_issuer.issuer
+            jwks = local_issuer.key_store()
+        self.domain = domain
+        self.audience = audience
+        self.algorithms = list(algorithms)
+        self.issuer = issuer or 'https://{}/'.format(domain)
+        self.jwks = jwks or JWKSKeyStore.for_domain(domain)
+        self.verified_tokens = token_cache or VerifiedTokenCache()
+
+    def get_token_auth_header(self):
+        auth = request.headers.get('Authorization', None)
+        if not auth:
+            raise AuthError({
+                'code': 'authorization_header_missing',
+                'description': 'Authorization header is expected.'
+            }, 401)
+        parts = auth.split()
+        if parts[0].lower() != 'bearer':
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Authorization header must start with "Bearer".'
+            }, 401)
+        elif len(parts) == 1:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Token not found.'
+            }, 401)
+        elif len(parts) > 2:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Authorization header must be bearer token.'
+            }, 401)
+        return parts[1]
+
+    def verify_decode_jwt(self, token):
+        '''
+        verify_decode_jwt(token)
+            the VerifiedPayload of token, checked against the issuer's
+            signing keys, audience and issuer, or from the cache when the
+            token was verified before
+        '''
+        if self.verified_tokens.is_revoked(token):
+            raise AuthError({
+                'code': 'token_revoked',
+                'description': 'Token has been revoked.'
+            }, 401)
+        payload = self.verified_tokens.get(token)
+        if payload is not None:
+            return payload
+        try:
+            unverified_header = jwt.get_unverified_header(token)
+        except jwt.JWTError:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Unable to parse authentication token.'
+            }, 401)
+        if 'kid' not in unverified_header:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Authorization malformed.'
+            }, 401)
+        key = self.jwks.get(unverified_header['kid'])
+        if key is None:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Unable to find the appropriate key.'
+            }, 401)
+        try:
+            claims = jwt.decode(token, key, algorithms=self.algorithms,
+                                audience=self.audience, issuer=self.issuer)
+        except jwt.ExpiredSignatureError:
+            raise AuthError({
+                'code': 'token_expired',
+                'description': 'Token expired.'
+            }, 401)
+        except jwt.JWTClaimsError:
+            raise AuthError({
+                'code': 'invalid_claims',
+                'description': 'Incorrect claims. Please, check the audience and issuer.'
+            }, 401)
+        except Exception:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Unable to parse authentication token.'
+            }, 401)
+        payload = VerifiedPayload(claims)
+        self.verified_tokens.put(token, payload)
+        return payload
+
+    def revoke(self, token):
+        self.verified_tokens.revoke(token)
+
+    def check_permissions(self, permissions, payload, require='all'):
+        '''
+        check_permissions(permissions, payload, require='all')
+            raises AuthError unless payload grants every one (require='all')
+            or at least one (require='any') of permissions
+        '''
+        if isinstance(permissions, str):
+            permissions = (permissions,)
+        if not isinstance(payload, VerifiedPayload):
+            payload = VerifiedPayload(payload)
+        if not payload.has_permissions:
+            raise AuthError({
+                'code': 'invalid_claims',
+                'description': 'Permissions not included in JWT.'
+            }, 400)
+        if not permissions:
+            return True
+        if require == 'any':
+            granted = not payload.permissions.isdisjoint(permissions)
+        else:
+            granted = payload.permissions.issuperset(permissions)
+        if not granted:
+            raise AuthError({
+                'code': 'unauthorized',
+                'description': 'Permission not found.'
+            }, 403)
+        return True
+
+    def requires_auth(self, *permissions, require='all'):
+        '''
+        @requires_auth('post:drinks', 'patch:drinks', require='any')
+            lets a request through with a valid bearer token granting the
+            permissions, all of them unless require='any', and passes the
+            verified payload to the view as its first argument. With no
+            permissions any valid token is enough.
+        '''
+        if require not in ('all', 'any'):
+            raise ValueError("require must be 'all' or 'any'")
+        permissions = frozenset(permission for permission in permissions
+                                if permission)
+
+        def requires_auth_decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                token = self.get_token_auth_header()
+                payload = self.verify_decode_jwt(token)
+                if permissions:
+                    self.check_permissions(permissions, payload, require)
+                return f(payload, *args, **kwargs)
+            return wrapper
+        return requires_auth_decorator
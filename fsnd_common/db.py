@@ -0,0 +1,154 @@
+'''
+Engine options and connection pool statistics for the apps' SQLAlchemy()
+instances.
+
+configure_engine(app) turns the DB_* settings below into
+SQLALCHEMY_ENGINE_OPTIONS. Each setting is read from app.config, then from
+the environment, then falls back to the default:
+
+    DB_POOL_SIZE            connections kept open per process          (5)
+    DB_MAX_OVERFLOW         extra connections allowed under load       (10)
+    DB_POOL_TIMEOUT         seconds to wait for a free connection      (30)
+    DB_POOL_RECYCLE         seconds before a connection is replaced    (1800)
+    DB_POOL_PRE_PING        test connections on checkout               (True)
+    DB_STATEMENT_TIMEOUT    Postgres statement_timeout in ms, 0 = none (0)
+    DB_SERVER_SIDE_CURSORS  stream results through named cursors       (False)
+    DB_POOL_ENDPOINT        serve GET /_pool, see below                (False)
+
+register_pool_endpoint(app, db) adds GET /_pool, which reports checked-out
+and overflow connections and a histogram of the time spent waiting for a
+connection. The route has no authentication, so it is only added when
+DB_POOL_ENDPOINT is set; turn it on where the app is not reachable from
+outside, such as local load tests.
+'''
+import bisect
+import os
+import threading
+import time
+
+from flask import jsonify
+from sqlalchemy.pool import QueuePool
+
+DEFAULTS = {
+    'DB_POOL_SIZE': 5,
+    'DB_MAX_OVERFLOW': 10,
+    'DB_POOL_TIMEOUT': 30,
+    'DB_POOL_RECYCLE': 1800,
+    'DB_POOL_PRE_PING': True,
+    'DB_STATEMENT_TIMEOUT': 0,
+    'DB_SERVER_SIDE_CURSORS': False,
+    'DB_POOL_ENDPOINT': False,
+}
+
+# Upper bounds, in milliseconds, of the checkout wait histogram buckets.
+WAIT_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class Histogram(object):
+    def __init__(self, bounds=WAIT_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.total += 1
+            self.sum += value
+
+    def to_dict(self):
+        with self.lock:
+            labels = ['<={}'.format(bound) for bound in self.bounds]
+            labels.append('>{}'.format(self.bounds[-1]))
+            return {'buckets': dict(zip(labels, self.counts)),
+                    'count': self.total,
+                    'sum': round(self.sum, 3)}
+
+
+class TimedQueuePool(QueuePool):
+    '''
+    TimedQueuePool
+        QueuePool that records how long each checkout waited for a
+        connection, in milliseconds
+    '''
+    def __init__(self, *args, **kwargs):
+        super(TimedQueuePool, self).__init__(*args, **kwargs)
+        self.wait_ms = Histogram()
+
+    def _do_get(self):
+        started = time.time()
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        finally:
+            self.wait_ms.observe((time.time() - started) * 1000)
+
+
+def _setting(config, key):
+    default = DEFAULTS[key]
+    value = config.get(key, os.environ.get(key, default))
+    if isinstance(default, bool) and isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return type(default)(value)
+
+
+def engine_options(config, database_uri):
+    '''
+    engine_options(app.config, uri)
+        create_engine() keyword arguments for the DB_* settings
+    '''
+    options = {'pool_pre_ping': _setting(config, 'DB_POOL_PRE_PING')}
+    if database_uri.startswith('sqlite'):
+        # SQLite uses its own single-connection pools; sizing does not apply.
+        return options
+
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': _setting(config, 'DB_POOL_SIZE'),
+        'max_overflow': _setting(config, 'DB_MAX_OVERFLOW'),
+        'pool_timeout': _setting(config, 'DB_POOL_TIMEOUT'),
+        'pool_recycle': _setting(config, 'DB_POOL_RECYCLE'),
+    })
+    if database_uri.startswith('postgres'):
+        statement_timeout = _setting(config, 'DB_STATEMENT_TIMEOUT')
+        if statement_timeout:
+            options['connect_args'] = {
+                'options': '-c statement_timeout={}'.format(statement_timeout)}
+        if _setting(config, 'DB_SERVER_SIDE_CURSORS'):
+            options['execution_options'] = {'stream_results': True}
+    return options
+
+
+def configure_engine(app):
+    '''
+    configure_engine(app)
+        sets SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings; call it after
+        SQLALCHEMY_DATABASE_URI is set and before the engine is first used
+    '''
+    options = engine_options(app.config, app.config['SQLALCHEMY_DATABASE_URI'])
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__, 'status': pool.status()}
+    if isinstance(pool, QueuePool):
+        stats.update({'size': pool.size(),
+                      'checked_in': pool.checkedin(),
+                      'checked_out': pool.checkedout(),
+                      'overflow': pool.overflow()})
+    if isinstance(pool, TimedQueuePool):
+        stats['wait_ms'] = pool.wait_ms.to_dict()
+    return stats
+
+
+def register_pool_endpoint(app, db):
+    if not _setting(app.config, 'DB_POOL_ENDPOINT') or \
+            'pool_stats' in app.view_functions:
+        return
+
+    def pool_stats_view():
+        return jsonify(pool_stats(db.get_engine(app)))
+    app.add_url_rule('/_pool', 'pool_stats', pool_stats_view)
@@ -0,0 +1,199 @@
+'''
+Cached JSON Web Key Set for the apps' verify_decode_jwt().
+
+JWKSKeyStore fetches the issuer's /.well-known/jwks.json (or reads a local
+JWKS file) once, builds the RSA public key for every kid up front and
+answers lookups from memory. The keys are good for ttl seconds; a daemon
+thread refetches them early, at refresh_ratio of the ttl give or take
+jitter so a fleet of workers does not refetch in step, and requests keep
+using the current keys meanwhile. Only a request arriving after the hard
+expiry (background refresh off or failing) fetches the set itself. A token
+signed with a kid the store does not know triggers one synchronous refetch,
+to pick up a key rotated in since the last refresh, at most once per
+min_refetch_interval whatever the kid, so made up kids cannot make every
+request fetch from the issuer.
+
+    jwks = JWKSKeyStore.for_domain(AUTH0_DOMAIN)
+    key = jwks.get(unverified_header['kid'])
+    payload = jwt.decode(token, key, algorithms=['RS256'], ...)
+
+Setting JWKS_FILE in the environment makes for_domain() read keys from that
+file instead of the network, for tests and air-gapped deployments.
+'''
+import json
+import logging
+import os
+import random
+import threading
+import time
+from urllib.request import urlopen
+
+from jose import jwk
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 3600
+DEFAULT_JITTER = 0.1
+# Share of the ttl after which the background thread refetches the keys.
+DEFAULT_REFRESH_RATIO = 0.8
+MIN_REFETCH_INTERVAL = 30
+FETCH_TIMEOUT = 10
+
+
+class JWKSKeyStore(object):
+    def __init__(self, url=None, path=None, algorithm='RS256',
+                 ttl=DEFAULT_TTL, jitter=DEFAULT_JITTER,
+                 refresh_ratio=DEFAULT_REFRESH_RATIO,
+                 min_refetch_interval=MIN_REFETCH_INTERVAL,
+                 background=True):
+        if not url and not path:
+            raise ValueError('JWKSKeyStore needs a url or a path')
+        self.url = url
+        self.path = path
+        self.algorithm = algorithm
+        self.ttl = ttl
+        self.jitter = jitter
+        self.refresh_ratio = refresh_ratio
+        self.min_refetch_interval = min_refetch_interval
+        self.background = background
+        self.keys = {}
+        self.loaded = False
+        self.refresh_at = 0
+        self.expires = 0
+        self.last_refetch = None
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.thread = None
+        self.thread_pid = None
+        self.stopped = threading.Event()
+
+    @classmethod
+    def for_domain(cls, domain, **kwargs):
+        '''
+        for_domain(domain)
+            the store for an Auth0 style issuer, or for the JWKS_FILE
+            named in the environment when set
+        '''
+        path = os.environ.get('JWKS_FILE')
+        if path:
+            return cls(path=path, **kwargs)
+        return cls(url='https://{}/.well-known/jwks.json'.format(domain),
+                   **kwargs)
+
+    def fetch(self):
+        if self.path:
+            with open(self.path) as f:
+                return json.load(f)
+        response = urlopen(self.url, timeout=FETCH_TIMEOUT)
+        try:
+            return json.loads(response.read().decode('utf-8'))
+        finally:
+            response.close()
+
+    def construct(self, key):
+        # jwt.decode() takes a list of keys and uses an already prepared
+        # public key as is, instead of parsing the modulus and exponent of
+        # the JWK again on every call.
+        return [jwk.construct(key, self.algorithm).prepared_key]
+
+    def refresh(self, force=True):
+        '''
+        refresh(force=True)
+            refetches the key set and replaces every key; raises when the
+            set cannot be fetched, leaving the current keys in place. With
+            force=False a set that is loaded and not yet due for refresh is
+            kept.
+        '''
+        with self.refresh_lock:
+            if not force and self.loaded and time.time() < self.refresh_at:
+                return len(self.keys)
+            keys = {}
+            for key in self.fetch().get('keys', []):
+                kid = key.get('kid')
+                if not kid or key.get('kty') != 'RSA' or \
+                        key.get('use', 'sig') != 'sig':
+                    continue
+                try:
+                    keys[kid] = self.construct(key)
+                except Exception:
+                    logger.warning('skipping unusable JWKS key %s', kid)
+            spread = random.uniform(-self.jitter, self.jitter)
+            now = time.time()
+            with self.lock:
+                self.keys = keys
+                self.loaded = True
+                self.refresh_at = now + self.ttl * self.refresh_ratio * \
+                    (1 + spread)
+                self.expires = now + self.ttl
+            return len(keys)
+
+    def get(self, kid):
+        '''
+        get(kid)
+            the key argument for jwt.decode() of a token signed with kid,
+            or None when the issuer does not publish that kid
+        '''
+        if time.time() >= self.expires:
+            # first use, or the background refresh is off or failing
+            self._refresh_quietly(force=False)
+        self.start()
+        key = self.keys.get(kid)
+        if key is None and self._may_refetch(kid):
+            self._refresh_quietly()
+            key = self.keys.get(kid)
+        return key
+
+    def _may_refetch(self, kid):
+        # One interval for every kid: a refetch gets the whole current set,
+        # so a genuinely rotated kid is picked up by whichever came first.
+        now = time.time()
+        with self.lock:
+            if self.last_refetch is not None and \
+                    now - self.last_refetch < self.min_refetch_interval:
+                return False
+            self.last_refetch = now
+            return True
+
+    def _refresh_quietly(self, force=True):
+        try:
+            self.refresh(force)
+        except Exception:
+            logger.exception('fetching JWKS from %s failed',
+                             self.path or self.url)
+            # keep serving the keys we have until they expire and retry
+            # later, rather than fetching again on every request while the
+            # issuer is down
+            retry = time.time() + self.min_refetch_interval
+            with self.lock:
+                self.refresh_at = retry
+                self.expires = max(self.expires, retry)
+
+    def start(self):
+        '''
+        start()
+            starts the background refresh thread of this process; a forked
+            worker starts its own on first use
+        '''
+        if not self.background or (self.thread and
+                                    self.thread_pid == os.getpid()):
+            return
+        with self.lock:
+            if self.thread and self.thread_pid == os.getpid():
+                return
+            self.thread = threading.Thread(target=self._run,
+                                           name='jwks-refresh')
+            self.thread.daemon = True
+            self.thread_pid = os.getpid()
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            delay = self.refresh_at - time.time()
+            if delay > 0:
+                self.stopped.wait(delay)
+                if self.stopped.is_set():
+                    return
+            self._refresh_quietly(force=False)
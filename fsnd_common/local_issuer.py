@@ -0,0 +1,210 @@
+'''
+A stand-in for Auth0 that runs on this machine, for load tests and offline
+development.
+
+LocalIssuer keeps an RSA key pair in a PEM file (created on first use),
+publishes its public key as a JWKS file next to it and mints RS256 tokens
+carrying whatever permissions the caller asks for. Setting AUTH_ISSUER=local
+in an app's environment makes its Auth accept these tokens instead of
+Auth0's:
+
+    export AUTH_ISSUER=local
+    flask run
+    TOKEN=$(python -m fsnd_common.local_issuer mint \
+        --audience localhost:5000 --permission get:drinks_detail)
+    curl -H "Authorization: Bearer $TOKEN" localhost:5000/drinks-detail
+
+The key file is LOCAL_ISSUER_KEY, or ~/.fsnd/local-issuer.pem, so the app
+and the processes minting tokens share one key. Whoever can write the key
+can mint tokens the app accepts, so it is only loaded when the file and
+its directory belong to the current user and no one else can write them
+(or, for the file, read it).
+`python -m fsnd_common.local_issuer serve` also serves the JWKS over HTTP
+at /.well-known/jwks.json; point LOCAL_ISSUER_JWKS_URL at it to have apps
+fetch keys from there instead of the file.
+'''
+import argparse
+import base64
+import hashlib
+import json
+import os
+import stat
+import time
+
+from Crypto.PublicKey import RSA
+from jose import jwt
+
+from .jwks import JWKSKeyStore
+
+ISSUER = 'https://local-issuer.fsnd/'
+KEY_BITS = 2048
+DEFAULT_TOKEN_TTL = 3600
+
+
+def default_key_path():
+    return os.environ.get('LOCAL_ISSUER_KEY') or os.path.join(
+        os.path.expanduser('~'), '.fsnd', 'local-issuer.pem')
+
+
+def _check_private(path, status, mode_mask):
+    # os.getuid() does not exist on Windows, where files are per user anyway
+    if hasattr(os, 'getuid') and status.st_uid != os.getuid():
+        raise RuntimeError('{} belongs to another user'.format(path))
+    if stat.S_IMODE(status.st_mode) & mode_mask:
+        raise RuntimeError('{} is open to other users (mode {:o})'.format(
+            path, stat.S_IMODE(status.st_mode)))
+
+
+def _read_private_key(path):
+    '''
+    _read_private_key(path)
+        the key stored at path; raises RuntimeError unless the file and its
+        directory belong to the current user and no one else can write them
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    _check_private(directory, os.stat(directory),
+                   stat.S_IWGRP | stat.S_IWOTH)
+    # checked on the opened file, so it cannot be swapped in between
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+    with os.fdopen(fd, 'rb') as f:
+        _check_private(path, os.fstat(f.fileno()),
+                       stat.S_IRWXG | stat.S_IRWXO)
+        return RSA.importKey(f.read())
+
+
+def _b64_int(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+class LocalIssuer(object):
+    def __init__(self, key, issuer=ISSUER, jwks_path=None):
+        self.key = key
+        self.private_pem = key.exportKey('PEM')
+        self.issuer = issuer
+        self.jwks_path = jwks_path
+        fingerprint = hashlib.sha256(_b64_int(key.n).encode('ascii'))
+        self.kid = 'local-' + fingerprint.hexdigest()[:16]
+
+    @classmethod
+    def generate(cls, **kwargs):
+        return cls(RSA.generate(KEY_BITS), **kwargs)
+
+    @classmethod
+    def load_or_create(cls, path=None, **kwargs):
+        '''
+        load_or_create(path)
+            the issuer whose private key is stored at path, generating and
+            saving a new key when there is none; also (re)writes the JWKS
+            file beside it. Raises RuntimeError when the key file or its
+            directory is not private to the current user.
+        '''
+        path = path or default_key_path()
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        if not os.path.exists(path):
+            # written aside and linked into place, so a process starting at
+            # the same time never reads a half written key; the first link
+            # wins and every process then loads that key
+            temporary = '{}.{}.tmp'.format(path, os.getpid())
+            fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(RSA.generate(KEY_BITS).exportKey('PEM'))
+            try:
+                os.link(temporary, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(temporary)
+        key = _read_private_key(path)
+        kwargs.setdefault('jwks_path', os.path.splitext(path)[0] + '.jwks.json')
+        issuer = cls(key, **kwargs)
+        issuer.write_jwks()
+        return issuer
+
+    def jwks(self):
+        public = self.key.publickey()
+        return {'keys': [{'kty': 'RSA', 'kid': self.kid, 'use': 'sig',
+                          'alg': 'RS256',
+                          'n': _b64_int(public.n),
+                          'e': _b64_int(public.e)}]}
+
+    def write_jwks(self, path=None):
+        path = path or self.jwks_path
+        if self.jwks_path is None:
+            self.jwks_path = path
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'w') as f:
+            json.dump(self.jwks(), f)
+        os.replace(temporary, path)
+        return path
+
+    def key_store(self, **kwargs):
+        '''
+        key_store()
+            a JWKSKeyStore holding this issuer's public key, from
+            LOCAL_ISSUER_JWKS_URL when set and from the JWKS file otherwise
+        '''
+        url = os.environ.get('LOCAL_ISSUER_JWKS_URL')
+        if url:
+            return JWKSKeyStore(url=url, **kwargs)
+        return JWKSKeyStore(path=self.jwks_path, **kwargs)
+
+    def mint(self, audience, permissions=(), subject='local|load-test',
+             expires_in=DEFAULT_TOKEN_TTL, **claims):
+        '''
+        mint(audience, permissions)
+            a signed RS256 token for audience granting permissions
+        '''
+        now = int(time.time())
+        claims.update({'iss': self.issuer,
+                       'sub': subject,
+                       'aud': audience,
+                       'iat': now,
+                       'exp': now + expires_in,
+                       'permissions': list(permissions)})
+        return jwt.encode(claims, self.private_pem, algorithm='RS256',
+                          headers={'kid': self.kid})
+
+    def register_jwks_endpoint(self, app):
+        from flask import jsonify
+
+        @app.route('/.well-known/jwks.json')
+        def local_issuer_jwks():
+            return jsonify(self.jwks())
+        return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m fsnd_common.local_issuer',
+                                     description='Offline token issuer.')
+    parser.add_argument('--key', default=None,
+                        help='private key file (default: LOCAL_ISSUER_KEY '
+                             'or ~/.fsnd/local-issuer.pem)')
+    commands = parser.add_subparsers(dest='command')
+    mint = commands.add_parser('mint', help='print a signed token')
+    mint.add_argument('--audience', required=True)
+    mint.add_argument('--permission', action='append', default=[])
+    mint.add_argument('--subject', default='local|load-test')
+    mint.add_argument('--expires-in', type=int, default=DEFAULT_TOKEN_TTL)
+    commands.add_parser('jwks', help='write the JWKS file and print its path')
+    serve = commands.add_parser('serve', help='serve the JWKS over HTTP')
+    serve.add_argument('--port', type=int, default=5999)
+    args = parser.parse_args(argv)
+
+    issuer = LocalIssuer.load_or_create(args.key)
+    if args.command == 'mint':
+        print(issuer.mint(args.audience, args.permission,
+                          subject=args.subject, expires_in=args.expires_in))
+    elif args.command == 'serve':
+        from flask import Flask
+        app = issuer.register_jwks_endpoint(Flask(__name__))
+        app.run(port=args.port)
+    else:
+        print(issuer.jwks_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+'''
+Verified bearer tokens, so a token the app has already checked is not run
+through RS256 verification again on every request.
+
+VerifiedTokenCache keeps the decoded payload of up to maxsize tokens, least
+recently used dropped first, keyed by the SHA-256 of the token so the cache
+holds no usable credentials. An entry lives until the token's exp claim;
+tokens without one are never cached. revoke(token) drops a token and
+refuses it until it would have expired anyway.
+
+    payload = verified_tokens.get(token)
+    if payload is None:
+        payload = jwt.decode(token, ...)
+        verified_tokens.put(token, payload)
+'''
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAXSIZE = 10000
+# How long a revoked token that was never cached stays refused.
+REVOKED_TTL = 86400
+
+
+def token_key(token):
+    if not isinstance(token, bytes):
+        token = token.encode('utf-8')
+    return hashlib.sha256(token).digest()
+
+
+class VerifiedTokenCache(object):
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.revoked = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        '''
+        get(token)
+            the cached payload of token, or None when it is not cached,
+            has expired or was revoked
+        '''
+        key = token_key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires = entry
+            if expires <= self.clock():
+                del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, token, payload):
+        expires = payload.get('exp')
+        if not isinstance(expires, (int, float)):
+            return
+        key = token_key(token)
+        with self.lock:
+            if expires <= self.clock() or key in self.revoked:
+                return
+            self.entries[key] = (payload, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def is_revoked(self, token):
+        if not self.revoked:
+            return False
+        key = token_key(token)
+        with self.lock:
+            expires = self.revoked.get(key)
+            if expires is None:
+                return False
+            if expires <= self.clock():
+                del self.revoked[key]
+                return False
+            return True
+
+    def revoke(self, token, expires=None):
+        '''
+        revoke(token)
+            forgets token and refuses it until its exp (or until expires,
+            for a token that was never cached)
+        '''
+        key = token_key(token)
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if expires is None:
+                expires = entry[1] if entry else self.clock() + REVOKED_TTL
+            self.revoked[key] = expires
+            self._forget_expired_revocations()
+
+    def _forget_expired_revocations(self):
+        now = self.clock()
+        for key in [key for key, expires in self.revoked.items()
+                    if expires <= now]:
+            del self.revoked[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries),
+                    'revoked': len(self.revoked),
+                    'hits': self.hits,
+                    'misses': self.misses}
@@ -3,9 +3,7 @@
 #----------------------------------------------------------------------------#
 
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, stream_with_context, jsonify
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 import logging
@@ -14,6 +12,11 @@ from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
 from models import Venue, Artist, Show, db_setup
+from cache import page_cache
+import counters
+import formatting
+import importer
+import queries
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -21,6 +24,9 @@ from models import Venue, Artist, Show, db_setup
 app = Flask(__name__)
 moment = Moment(app)
 db = db_setup(app)
+page_cache.init_app(app)
+counters.register_commands(app)
+importer.register_commands(app)
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -31,15 +37,31 @@ db.create_all()
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
-
-app.jinja_env.filters['datetime'] = format_datetime
+app.jinja_env.filters['datetime'] = formatting.format_datetime
+
+def genre_facets(endpoint, counts, selected):
+  # facet entries for the listing templates; url toggles the genre in or
+  # out of the current selection
+  facets = []
+  for genre, count in counts:
+    if genre in selected:
+      toggled = [g for g in selected if g != genre]
+    else:
+      toggled = selected + [genre]
+    facets.append({'genre': genre,
+                   'count': count,
+                   'selected': genre in selected,
+                   'url': url_for(endpoint, genre=toggled)})
+  return facets
+
+def stream_template(template_name, **context):
+  # render_template, but yielding the page in chunks as the context's
+  # iterables are consumed
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  stream = template.stream(context)
+  stream.enable_buffering(5)
+  return stream
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -54,101 +76,32 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@page_cache.cached('venues')
 def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-
-  rows = Venue.query.distinct(Venue.city, Venue.state).order_by(Venue.city).all()
-  data = []
-
-  for row in rows:
-        city = row.city
-        state = row.state
-        venues = db.session.query(Venue).filter(Venue.city == city)
-        for venue in venues:
-            venue_id = venue.id
-            venue_name = venue.name
-            listOfUpcomingShows = Venue.query.join(Show, Show.venue_id == Venue.id).filter(Show.start_time > datetime.utcnow()).all()
-            print(listOfUpcomingShows)
-
-            data.append({
-                        'city': city,
-                        'state': state,
-                        'venues': [{'id': venue_id,
-                                    'name': venue_name,
-                                    'num_upcoming_shows':len(listOfUpcomingShows)}]                                        })
-
-  return render_template('pages/venues.html', areas=data);
+  # ?genre=Jazz&genre=Folk narrows the listing to venues with every genre;
+  # ?format=json returns the listing and its genre counts as JSON
+  genres = request.args.getlist('genre')
+  areas, counts = queries.venue_listing(genres)
+  facets = genre_facets('venues', counts, genres)
+  if request.args.get('format') == 'json':
+    return jsonify({'areas': areas, 'genres': facets})
+  return render_template('pages/venues.html', areas=areas, facets=facets)
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  tag = request.form.get('search_term', None)
-  search_term = "%{}%".format(tag)
-  query_search = db.session.query(Venue).filter(Venue.name.ilike(search_term)).all()
-  count_venues = len(query_search)
-  now = datetime.utcnow()
-  data = []
-  for venue in query_search:
-      datum = {
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows": 0,
-      }
-      data.append(datum)
-
-  response = {'count':count_venues,
-                'data': data}
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  search_term = request.form.get('search_term', '')
+  page = max(request.form.get('page', 1, type=int), 1)
+  response = queries.venue_search(search_term, page)
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
+@page_cache.cached('venue', 'venue_id')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  venue = Venue.query.get(venue_id)
-  shows = Show.query.filter(Show.venue_id == venue_id).all()
-  now = datetime.utcnow()
-
-  upcoming_shows_list = db.session.query(Show, Artist).join(Artist).filter(Show.venue_id == venue_id).filter(Show.start_time > now).all()
-  past_shows_list = db.session.query(Show, Artist).join(Artist).filter(venue_id == Show.venue_id).filter(Show.start_time < now).all()
-
-  upcoming_list = list()
-  for show in upcoming_shows_list:
-      data = {'artist_id': show.Show.artist_id,
-      'artist_name': show.Artist.name,
-      'artist_image_link': show.Artist.image_link,
-      'start_time': str(show.Show.start_time)}
-      upcoming_list.append(data)
-  #
-  past_list = list()
-  for show in upcoming_shows_list:
-      data = {'artist_id': show.Show.artist_id,
-      'artist_name': show.Artist.name,
-      'artist_image_link': show.Artist.image_link,
-      'start_time': str(show.Show.start_time)}
-      past_list.append(data)
-
-  data = {'id': venue.id,
-                'name':venue.name,
-                'genres': ['Test1', 'Test2'],
-                'address': venue.address,
-                'city': venue.city,
-                'state': venue.state,
-                'phone': venue.phone,
-                'website': venue.website,
-                'facebook_link': venue.facebook_link,
-                'seeking_talent': venue.seeking_talent,
-                'seeking_description': venue.seeking_description,
-                'image_link': venue.image_link,
-                'past_shows': past_list,
-                'upcoming_shows': upcoming_list,
-                'past_shows_count': len(past_list),
-                'upcoming_shows_count': len(upcoming_list)}
-  result = data
-
-  return render_template('pages/show_venue.html', venue=result)
+  venue = queries.venue_detail(venue_id)
+  if venue is None:
+    abort(404)
+  return render_template('pages/show_venue.html', venue=venue)
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -168,7 +121,7 @@ def create_venue_submission():
       new_venue = Venue(name = request.form['name'],
                         city = request.form['city'],
                         state = request.form['state'],
-                        #genres = request.form.getlist('genres'),
+                        genres = request.form.getlist('genres'),
                         address = request.form['address'],
                         phone = request.form['phone'],
                         facebook_link= request.form['facebook_link'])
@@ -197,6 +150,10 @@ def delete_venue(venue_id):
   try:
       Venue.query.filter_by(id = venue_id).delete()
       db.session.commit()
+      # bulk deletes skip the mapper events the page cache listens to
+      page_cache.invalidate('venue', int(venue_id))
+      page_cache.invalidate('venues')
+      page_cache.invalidate('shows')
   except:
       db.session.rollback()
   finally:
@@ -208,91 +165,31 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@page_cache.cached('artists')
 def artists():
-  # TODO: replace with real data returned from querying the database
-
-  artists = Artist.query.all()
-  data = []
-  for artist in artists:
-      datum = {'id':artist.id,
-               'name': artist.name}
-      data.append(datum)
-
-  return render_template('pages/artists.html', artists=data)
+  # same ?genre= and ?format=json parameters as /venues
+  genres = request.args.getlist('genre')
+  data, counts = queries.artist_listing(genres)
+  facets = genre_facets('artists', counts, genres)
+  if request.args.get('format') == 'json':
+    return jsonify({'artists': data, 'genres': facets})
+  return render_template('pages/artists.html', artists=data, facets=facets)
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
-  tag = request.form.get('search_term', None)
-  search_term = '%' + tag + '%'
-  now = datetime.utcnow()
-  data_list = db.session.query(Artist).filter(Artist.name.ilike(search_term)).all()
-  count_artist = len(data_list)
-  data = []
-
-  for artist in data_list:
-      numUpcomingShows = len(Show.query.join(Artist, Artist.id == Show.artist_id).filter(Show.artist_id == artist.id).filter(Show.start_time > now).all())
-      datum = {'id': artist.id,
-                'name': artist.name,
-                'num_upcoming_shows': numUpcomingShows
-                }
-      data.append(datum)
-
-  response={
-        'count': count_artist,
-        'data': data}
-
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  search_term = request.form.get('search_term', '')
+  page = max(request.form.get('page', 1, type=int), 1)
+  response = queries.artist_search(search_term, page)
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 @app.route('/artists/<int:artist_id>')
+@page_cache.cached('artist', 'artist_id')
 def show_artist(artist_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  artist = Artist.query.get(artist_id)
-  shows = Show.query.filter(Show.artist_id == artist_id).all()
-
-  now = datetime.utcnow()
-  past_shows_list = db.session.query(Show, Venue).join(Venue).filter(Show.artist_id == artist_id).filter(Show.start_time < now).all()
-  upcoming_shows_list = db.session.query(Show, Venue).join(Venue).filter(Show.artist_id == artist_id).filter(Show.start_time > now).all()
-
-  past_list = list()
-  for show in past_shows_list:
-     data = {'venue_id': show.Show.Venue.id,
-     'venue_name': show.Venue.name,
-     'venue_image_link': show.Venue.image_link,
-     'start_time': show.Show.start_time}
-     past_list.append(data)
-
-  upcoming_list = list()
-  for show in upcoming_shows_list:
-     data = {'venue_id': show.Show.Venue.id,
-     'venue_name': show.Venue.name,
-     'venue_image_link': show.Venue.image_link,
-     'start_time': show.Show.start_time}
-     upcoming_list.append(data)
-
-
-  datum = {
-    "id": artist.id,
-    "name": artist.name,
-    "genres": artist.genres,
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "website": artist.website_link,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_venue,
-    "seeking_description": artist.seeking_description,
-    "image_link": artist.image_link,
-    "past_shows": past_list,
-    "upcoming_shows": upcoming_list,
-    "past_shows_count": len(past_list),
-    "upcoming_shows_count": len(upcoming_list)}
-
-  data = list(datum)
-  return render_template('pages/show_artist.html', artist=data)
+  # shows the artist page with the given artist_id
+  artist = queries.artist_detail(artist_id)
+  if artist is None:
+    abort(404)
+  return render_template('pages/show_artist.html', artist=artist)
 
 #  Update
 #  ----------------------------------------------------------------
@@ -379,7 +276,7 @@ def edit_venue_submission(venue_id):
   try:
       venue = Venue.query.get(venue_id)
       venue.name = request.form['name'],
-      venue.genres = request.form['genres']
+      venue.genres = request.form.getlist('genres')
       venue.address = request.form['address']
       venue.city = request.form['city']
       venue.state = request.form['state']
@@ -421,7 +318,7 @@ def create_artist_submission():
              city = request.form['city'],
              state = request.form['state'],
              phone = request.form['phone'],
-             genres = request.form['genres'],
+             genres = request.form.getlist('genres'),
              image_link = request.form['image_link'],
              facebook_link = request.form['facebook_link'],
              seeking_description = request.form['seeking_description'],
@@ -446,22 +343,18 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@page_cache.cached('shows')
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data = []
-  shows = db.session.query(Show, Artist, Venue).join(Artist).join(Venue).all()
-  for show in shows:
-      datum = {'venue_id': show.Show.venue_id,
-                'venue_name': show.Venue.name,
-                'artist_id': show.Show.artist_id,
-                'artist_name': show.Artist.name,
-                'artist_image_link': show.Artist.image_link,
-                'start_time': str(show.Show.start_time)}
-      data.append(datum)
-
-  return render_template('pages/shows.html', shows=data)
+  # displays list of shows at /shows, one keyset page at a time, or all of
+  # them streamed to the browser as they are fetched with ?stream=1
+  if request.args.get('stream', 0, type=int):
+    return Response(stream_with_context(
+      stream_template('pages/shows.html', shows=queries.show_stream())))
+  try:
+    data, next_cursor = queries.show_page(request.args.get('after'))
+  except ValueError:
+    abort(400)
+  return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
 
 @app.route('/shows/create')
 def create_shows():
@@ -489,6 +382,23 @@ def create_show_submission():
           db.session.close()
   return render_template('pages/home.html')
 
+#  Import
+#  ----------------------------------------------------------------
+
+@app.route('/import/<kind>', methods=['POST'])
+def import_upload(kind):
+  # bulk loads an uploaded CSV or JSON file, see importer.py
+  upload = request.files.get('file')
+  if kind not in importer.IMPORTS or upload is None:
+    abort(400)
+  report = importer.import_file(kind, upload.stream, importer.format_for(upload.filename))
+  return jsonify(report.to_dict())
+
+@app.route('/_stats/formatting')
+def formatting_stats():
+  # hit/miss counters of the datetime filter cache, for monitoring
+  return jsonify(formatting.cache_stats())
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
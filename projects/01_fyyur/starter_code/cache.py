@@ -0,0 +1,266 @@
+#----------------------------------------------------------------------------#
+# Page cache.
+#
+# Rendered pages are cached per (page kind, entity id, query string) and
+# served with an ETag, so a repeat visitor with a matching If-None-Match
+# gets a 304. Instead of deleting keys, invalidation bumps a version number
+# stored next to the entries; the stale entries just stop being looked up
+# and age out of the LRU. Works the same way on any backend that has
+# get/set/incr, including one shared between processes:
+#
+#   PAGE_CACHE_BACKEND  'memory' (default) or 'redis'
+#   PAGE_CACHE_URL      redis URL for the shared backend
+#   PAGE_CACHE_SIZE     entries kept by the memory backend
+#   PAGE_CACHE_TIMEOUT  seconds an entry lives; bounds staleness from the
+#                       passage of time (upcoming shows becoming past)
+#
+# Versions are bumped when a session that wrote a Venue, Artist or Show
+# commits: mapper events collect the pages the write shows up on -- its own,
+# the listings, /shows and the detail pages linked to it through Show -- and
+# a rollback discards them.
+#----------------------------------------------------------------------------#
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from models import Venue, Artist, Show
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class LRUCache(object):
+    '''
+    LRUCache(maxsize)
+        in-process cache backend; least recently used entries are evicted
+    '''
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + timeout if timeout else None
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def get_version(self, key):
+        return self.get(key) or 0
+
+    def incr(self, key):
+        with self.lock:
+            value = self.entries.get(key, (0, None))[0] + 1
+            self.entries[key] = (value, None)
+            self.entries.move_to_end(key)
+            return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class RedisCache(object):
+    '''
+    RedisCache(url)
+        cache backend shared by every worker pointing at the same redis;
+        takes an already connected client instead of url when given one
+    '''
+    def __init__(self, url=None, prefix='fyyur:page:', client=None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError('PAGE_CACHE_BACKEND = "redis" needs the redis package')
+            client = redis.StrictRedis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key):
+        return self.prefix + repr(key)
+
+    def get(self, key):
+        value = self.client.get(self._key(key))
+        if value is None:
+            return None
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=None):
+        self.client.set(self._key(key), pickle.dumps(value), ex=timeout)
+
+    def get_version(self, key):
+        # Versions are plain integers, not pickles, so redis can increment
+        # them atomically; they are read back as such.
+        return int(self.client.get(self._key(key)) or 0)
+
+    def incr(self, key):
+        return self.client.incr(self._key(key))
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class PageCache(object):
+    def __init__(self, app=None):
+        self.backend = LRUCache()
+        self.timeout = 300
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_BACKEND', 'memory')
+        app.config.setdefault('PAGE_CACHE_SIZE', 1024)
+        app.config.setdefault('PAGE_CACHE_TIMEOUT', 300)
+        if app.config['PAGE_CACHE_BACKEND'] == 'redis':
+            self.backend = RedisCache(app.config['PAGE_CACHE_URL'])
+        else:
+            self.backend = LRUCache(app.config['PAGE_CACHE_SIZE'])
+        self.timeout = app.config['PAGE_CACHE_TIMEOUT']
+
+    def version(self, kind, id=None):
+        return self.backend.get_version(('version', kind, id))
+
+    def invalidate(self, kind, id=None):
+        self.backend.incr(('version', kind, id))
+
+    def clear(self):
+        self.backend.clear()
+
+    def cached(self, kind, id_arg=None):
+        '''
+        @page_cache.cached('venue', 'venue_id')
+            caches the view's response per entity and query string, and
+            answers conditional requests for it with 304
+        '''
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Flashed messages are rendered into the page, so a page
+                # carrying them is neither served from nor stored in cache.
+                if current_app.config.get('PAGE_CACHE_DISABLED') or '_flashes' in session:
+                    return view(*args, **kwargs)
+
+                id = kwargs.get(id_arg) if id_arg else None
+                key = ('page', kind, id, self.version(kind, id),
+                       request.query_string)
+                entry = self.backend.get(key)
+                if entry is not None:
+                    body, etag, mimetype = entry
+                    response = current_app.response_class(body, mimetype=mimetype)
+                    response.set_etag(etag)
+                    return response.make_conditional(request)
+
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                response.add_etag()
+                etag = response.get_etag()[0]
+                self.backend.set(key, (response.get_data(), etag, response.mimetype),
+                                 self.timeout)
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+
+page_cache = PageCache()
+
+
+def _pending(target):
+    '''
+    _pending(target)
+        the set of (kind, id) versions to bump once the session writing
+        target commits, or None when target has no session
+    '''
+    session = object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault('page_cache_pending', set())
+
+
+def _invalidate_later(target, keys):
+    # Bumped after commit, not during the flush: a request rendering the
+    # page in between would otherwise read the old committed rows and store
+    # them under the new version.
+    pending = _pending(target)
+    if pending is None:
+        for kind, id in keys:
+            page_cache.invalidate(kind, id)
+    else:
+        pending.update(keys)
+
+
+def _linked(connection, column, id, other_column):
+    # ids of the entities sharing a show with the entity written; their
+    # detail pages list its name and image
+    shows = Show.__table__
+    return [row[0] for row in connection.execute(
+        select([shows.c[other_column]]).where(shows.c[column] == id).distinct())]
+
+
+@event.listens_for(Venue, 'after_insert')
+@event.listens_for(Venue, 'after_update')
+@event.listens_for(Venue, 'after_delete')
+def _venue_changed(mapper, connection, target):
+    keys = [('venue', target.id), ('venues', None), ('shows', None)]
+    keys.extend(('artist', artist_id) for artist_id in
+                _linked(connection, 'venue_id', target.id, 'artist_id'))
+    _invalidate_later(target, keys)
+
+
+@event.listens_for(Artist, 'after_insert')
+@event.listens_for(Artist, 'after_update')
+@event.listens_for(Artist, 'after_delete')
+def _artist_changed(mapper, connection, target):
+    keys = [('artist', target.id), ('artists', None), ('shows', None)]
+    keys.extend(('venue', venue_id) for venue_id in
+                _linked(connection, 'artist_id', target.id, 'venue_id'))
+    _invalidate_later(target, keys)
+
+
+@event.listens_for(Show, 'after_insert')
+@event.listens_for(Show, 'after_update')
+@event.listens_for(Show, 'after_delete')
+def _show_changed(mapper, connection, target):
+    # Show writes also move the venue/artist counters (counters.py).
+    keys = [('venue', target.venue_id), ('artist', target.artist_id),
+            ('venues', None), ('artists', None), ('shows', None)]
+    # a show moved to another venue or artist leaves the old one's page
+    state = inspect(target)
+    keys.extend(('venue', id) for id in state.attrs.venue_id.history.deleted)
+    keys.extend(('artist', id) for id in state.attrs.artist_id.history.deleted)
+    _invalidate_later(target, keys)
+
+
+@event.listens_for(Session, 'after_commit')
+def _session_committed(session):
+    for kind, id in session.info.pop('page_cache_pending', ()):
+        page_cache.invalidate(kind, id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _session_rolled_back(session, previous_transaction):
+    # A rolled back savepoint leaves the outer transaction's writes pending.
+    if previous_transaction.parent is None:
+        session.info.pop('page_cache_pending', None)
@@ -10,4 +10,8 @@ DEBUG = True
 
 
 # TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://AdrianLievano@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL',
+                                         'postgresql://AdrianLievano@localhost:5432/fyyur')
+
+# Connection pool settings (DB_POOL_SIZE, ...) are read from the
+# environment by fsnd_common/db.py.
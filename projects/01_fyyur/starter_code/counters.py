@@ -0,0 +1,129 @@
+#----------------------------------------------------------------------------#
+# Denormalized show counters on Venue and Artist.
+#
+# Venue/Artist.upcoming_shows_count and past_shows_count let listing pages
+# show "n upcoming shows" without touching the Show table. They are kept
+# current in two ways:
+#
+#   * mapper events on Show adjust (on insert) or recount (on update and
+#     delete) the affected venue and artist inside the flush that writes
+#     the show;
+#   * `flask rollover-shows`, run from cron, moves shows whose start_time
+#     has passed since the last run from the upcoming to the past count.
+#
+# `flask recount-shows` rebuilds every counter from scratch.
+#----------------------------------------------------------------------------#
+
+from datetime import datetime, timedelta
+
+import click
+import dateutil.parser
+from sqlalchemy import event, func, inspect, select
+
+from cache import page_cache
+from models import db, Venue, Artist, Show
+
+COUNTED = ((Venue, 'venue_id'), (Artist, 'artist_id'))
+
+
+def _as_datetime(value):
+    # Shows created from the form carry start_time as a string until flushed.
+    if isinstance(value, datetime):
+        return value
+    return dateutil.parser.parse(value)
+
+
+def _adjust(connection, show, delta):
+    if _as_datetime(show.start_time) > datetime.utcnow():
+        column = 'upcoming_shows_count'
+    else:
+        column = 'past_shows_count'
+    for model, show_column in COUNTED:
+        table = model.__table__
+        connection.execute(table.update()
+                           .where(table.c.id == getattr(show, show_column))
+                           .values({column: table.c[column] + delta}))
+
+
+def recount(connection, model, show_column, ids=None, now=None):
+    '''
+    recount(connection, Venue, 'venue_id', [1, 2])
+        recomputes both counters of the given rows (all rows when ids is
+        None) from the Show table in one UPDATE
+    '''
+    if now is None:
+        now = datetime.utcnow()
+    table = model.__table__
+    shows = Show.__table__
+    owned = shows.c[show_column] == table.c.id
+    upcoming = select([func.count()]).where(owned)\
+        .where(shows.c.start_time > now).as_scalar()
+    past = select([func.count()]).where(owned)\
+        .where(shows.c.start_time <= now).as_scalar()
+    statement = table.update().values(upcoming_shows_count=upcoming,
+                                      past_shows_count=past)
+    if ids is not None:
+        if not ids:
+            return
+        statement = statement.where(table.c.id.in_(ids))
+    connection.execute(statement)
+
+
+def roll_over(connection, since, now=None):
+    '''
+    roll_over(connection, since)
+        recounts the venues and artists with a show that started in
+        (since, now], i.e. whose upcoming shows became past shows
+    '''
+    if now is None:
+        now = datetime.utcnow()
+    shows = Show.__table__
+    started = (shows.c.start_time > since) & (shows.c.start_time <= now)
+    for model, show_column in COUNTED:
+        ids = [row[0] for row in connection.execute(
+            select([shows.c[show_column]]).where(started).distinct())]
+        recount(connection, model, show_column, ids, now)
+
+
+@event.listens_for(Show, 'after_insert')
+def _show_inserted(mapper, connection, target):
+    _adjust(connection, target, 1)
+
+
+@event.listens_for(Show, 'after_delete')
+def _show_deleted(mapper, connection, target):
+    # Recounted rather than decremented: a show counted as upcoming whose
+    # start_time has passed since the last rollover would otherwise come off
+    # the past count, and the rollover never sees a deleted show again.
+    for model, show_column in COUNTED:
+        recount(connection, model, show_column, [getattr(target, show_column)])
+
+
+@event.listens_for(Show, 'after_update')
+def _show_updated(mapper, connection, target):
+    state = inspect(target)
+    for model, show_column in COUNTED:
+        ids = set([getattr(target, show_column)])
+        ids.update(state.attrs[show_column].history.deleted)
+        if state.attrs.start_time.history.has_changes() or len(ids) > 1:
+            recount(connection, model, show_column, ids)
+
+
+def register_commands(app):
+    @app.cli.command('rollover-shows')
+    @click.option('--hours', default=25, show_default=True,
+                  help='How far back to look for shows that have started.')
+    def rollover_shows_command(hours):
+        """Move shows that have started from upcoming to past counts."""
+        since = datetime.utcnow() - timedelta(hours=hours)
+        with db.engine.begin() as connection:
+            roll_over(connection, since)
+        page_cache.clear()
+
+    @app.cli.command('recount-shows')
+    def recount_shows_command():
+        """Rebuild every venue and artist show counter."""
+        with db.engine.begin() as connection:
+            for model, show_column in COUNTED:
+                recount(connection, model, show_column)
+        page_cache.clear()
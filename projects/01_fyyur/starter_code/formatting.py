@@ -0,0 +1,60 @@
+#----------------------------------------------------------------------------#
+# The `datetime` Jinja filter.
+#
+# Show tiles repeat the same handful of start times many times per page, so
+# the rendered strings are memoized in a bounded LRU. Babel patterns and
+# locales are parsed once per (format, locale) rather than once per call.
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+from functools import lru_cache
+
+import dateutil.parser
+from babel import Locale
+from babel.dates import LC_TIME, parse_pattern
+
+PATTERNS = {'full': "EEEE MMMM, d, y 'at' h:mma",
+            'medium': "EE MM, dd, y h:mma"}
+
+DEFAULT_LOCALE = LC_TIME or 'en_US'
+
+CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=None)
+def compiled_pattern(format, locale):
+    '''
+    compiled_pattern('full', 'en_US')
+        (DateTimePattern, Locale) for a named or literal Babel pattern
+    '''
+    return parse_pattern(PATTERNS.get(format, format)), Locale.parse(locale)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _render(value, format, locale):
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    pattern, locale = compiled_pattern(format, locale)
+    return pattern.apply(value, locale)
+
+
+def format_datetime(value, format='medium', locale=None):
+    '''
+    format_datetime(show.start_time, 'full')
+        value rendered with a named pattern ('full', 'medium') or a literal
+        Babel pattern. Accepts datetimes, or strings for older callers.
+    '''
+    return _render(value, format, locale or DEFAULT_LOCALE)
+
+
+def cache_stats():
+    info = _render.cache_info()
+    return {'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'maxsize': info.maxsize}
+
+
+# Warm the patterns every page uses.
+for name in PATTERNS:
+    compiled_pattern(name, DEFAULT_LOCALE)
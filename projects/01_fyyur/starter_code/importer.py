@@ -0,0 +1,280 @@
+#----------------------------------------------------------------------------#
+# Bulk import of venues, artists and shows.
+#
+# Input is read as a stream, one chunk of rows at a time:
+#
+#   csv   a header row naming the form fields, genres comma separated
+#   json  one JSON object per line; a top-level array is also accepted,
+#         but is read whole
+#
+# Every row is validated with the same form the create pages use. Valid rows
+# are inserted per chunk, in one transaction each, with COPY on Postgres and
+# executemany elsewhere. Invalid rows are reported with their line number
+# and do not stop the import.
+#
+#   flask import venues partner_venues.csv
+#   curl -F file=@partner_venues.csv localhost:5000/import/venues
+#----------------------------------------------------------------------------#
+
+import codecs
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+import click
+from werkzeug.datastructures import MultiDict
+
+from cache import page_cache
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Artist, Show
+import counters
+import search
+
+CHUNK_SIZE = 1000
+
+# kind: (model, form, columns filled from the form)
+IMPORTS = {
+    'venues': (Venue, VenueForm,
+               ('name', 'city', 'state', 'address', 'phone', 'image_link',
+                'genres', 'facebook_link')),
+    'artists': (Artist, ArtistForm,
+                ('name', 'city', 'state', 'phone', 'image_link', 'genres',
+                 'facebook_link', 'seeking_description', 'seeking_venue',
+                 'website_link')),
+    'shows': (Show, ShowForm,
+              ('artist_id', 'venue_id', 'start_time')),
+}
+
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportReport(object):
+    def __init__(self, kind):
+        self.kind = kind
+        self.rows = 0
+        self.inserted = 0
+        self.errors = []
+        self.started = time.time()
+        self.elapsed = 0.0
+
+    def error(self, line, messages):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': messages})
+
+    def finish(self):
+        self.elapsed = time.time() - self.started
+
+    @property
+    def rows_per_second(self):
+        if not self.elapsed:
+            return 0.0
+        return self.rows / self.elapsed
+
+    def to_dict(self):
+        return {'kind': self.kind,
+                'rows': self.rows,
+                'inserted': self.inserted,
+                'failed': self.rows - self.inserted,
+                'errors': self.errors,
+                'elapsed': round(self.elapsed, 3),
+                'rows_per_second': round(self.rows_per_second, 1)}
+
+
+def format_for(filename):
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    return 'json'
+
+
+def read_rows(stream, format):
+    '''
+    read_rows(stream, 'csv')
+        (line number, row dict) for every record in a binary or text stream
+    '''
+    if isinstance(stream.read(0), bytes):
+        stream = codecs.getreader('utf-8')(stream)
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    # Lines that are not valid JSON come through as None and are reported
+    # by import_rows() instead of ending the import.
+    first = stream.readline()
+    if first.lstrip().startswith('['):
+        try:
+            records = json.loads(first + stream.read())
+        except ValueError:
+            yield 1, None
+            return
+        for number, row in enumerate(records, 1):
+            yield number, row
+        return
+    for number, line in enumerate(_prepend(first, stream), 1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, None
+
+
+def _prepend(first, lines):
+    yield first
+    for line in lines:
+        yield line
+
+
+def _formdata(row):
+    formdata = MultiDict()
+    for field, value in row.items():
+        if value is None:
+            continue
+        if isinstance(value, list):
+            for item in value:
+                formdata.add(field, str(item))
+        elif field == 'genres':
+            for genre in str(value).split(','):
+                formdata.add(field, genre.strip())
+        elif isinstance(value, bool):
+            # BooleanField treats any non-empty string as true.
+            if value:
+                formdata.add(field, 'y')
+        else:
+            formdata.add(field, str(value))
+    return formdata
+
+
+def _values(model, form, columns):
+    values = dict((column, form.data[column]) for column in columns)
+    if model is Show:
+        values['artist_id'] = int(values['artist_id'])
+        values['venue_id'] = int(values['venue_id'])
+    return values
+
+
+def _missing_references(values):
+    # Shows pointing at unknown venues/artists would fail the whole chunk
+    # on the foreign keys; find them up front with one query per table.
+    missing = {}
+    for model, column in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+        ids = set(row[column] for row in values)
+        found = set(id for id, in db.session.query(model.id).filter(model.id.in_(ids)))
+        missing[column] = ids - found
+    return missing
+
+
+def _copy_literal(value):
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return '{' + ','.join('"{}"'.format(item.replace('\\', '\\\\').replace('"', '\\"'))
+                              for item in value) + '}'
+    return value
+
+
+def _insert(model, rows):
+    table = model.__table__
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        connection.execute(table.insert(), rows)
+        return
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_copy_literal(row[column]) for column in columns])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH CSV'.format(
+        table.name, ', '.join('"{}"'.format(column) for column in columns)), buffer)
+
+
+def import_rows(kind, rows, chunk_size=CHUNK_SIZE):
+    '''
+    import_rows('venues', read_rows(stream, 'csv'))
+        validates and inserts (line number, row) pairs chunk by chunk and
+        returns an ImportReport
+    '''
+    model, form_class, columns = IMPORTS[kind]
+    report = ImportReport(kind)
+    rows = iter(rows)
+    touched = {'venue_id': set(), 'artist_id': set()}
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        valid = []
+        for line, row in chunk:
+            report.rows += 1
+            if not isinstance(row, dict):
+                report.error(line, {'row': ['Not a JSON object.']})
+                continue
+            form = form_class(formdata=_formdata(row), meta={'csrf': False})
+            if not form.validate():
+                report.error(line, form.errors)
+                continue
+            try:
+                valid.append((line, _values(model, form, columns)))
+            except (TypeError, ValueError) as e:
+                report.error(line, {'row': [str(e)]})
+
+        if model is Show and valid:
+            missing = _missing_references([values for line, values in valid])
+            checked = []
+            for line, values in valid:
+                errors = dict((column, ['No such id.']) for column in missing
+                              if values[column] in missing[column])
+                if errors:
+                    report.error(line, errors)
+                else:
+                    checked.append((line, values))
+                    touched['venue_id'].add(values['venue_id'])
+                    touched['artist_id'].add(values['artist_id'])
+            valid = checked
+
+        if valid:
+            try:
+                _insert(model, [values for line, values in valid])
+                db.session.commit()
+                report.inserted += len(valid)
+            except Exception as e:
+                db.session.rollback()
+                for line, values in valid:
+                    report.error(line, {'row': [str(e)]})
+
+    # COPY/executemany bypass the mapper events that keep the show counters,
+    # the page cache and the in-process search index current.
+    if model is Show and report.inserted:
+        with db.engine.begin() as connection:
+            counters.recount(connection, Venue, 'venue_id', touched['venue_id'])
+            counters.recount(connection, Artist, 'artist_id', touched['artist_id'])
+    if report.inserted:
+        page_cache.clear()
+        search.reset_indexes()
+
+    report.finish()
+    return report
+
+
+def import_file(kind, stream, format, chunk_size=CHUNK_SIZE):
+    return import_rows(kind, read_rows(stream, format), chunk_size)
+
+
+def register_commands(app):
+    @app.cli.command('import')
+    @click.argument('kind', type=click.Choice(sorted(IMPORTS)))
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--chunk-size', default=CHUNK_SIZE, show_default=True)
+    def import_command(kind, path, chunk_size):
+        """Bulk load venues, artists or shows from a CSV or JSON file."""
+        with open(path, 'rb') as stream:
+            report = import_file(kind, stream, format_for(path), chunk_size)
+        for error in report.errors:
+            click.echo('line {}: {}'.format(error['line'], error['errors']), err=True)
+        click.echo('{} rows, {} inserted, {} failed in {:.1f}s ({:.0f} rows/s)'.format(
+            report.rows, report.inserted, report.rows - report.inserted,
+            report.elapsed, report.rows_per_second))
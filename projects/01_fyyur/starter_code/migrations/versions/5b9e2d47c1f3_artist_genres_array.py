@@ -0,0 +1,38 @@
+"""store Artist.genres as an indexed array
+
+Revision ID: 5b9e2d47c1f3
+Revises: c71f0e5a9d38
+Create Date: 2026-10-18 12:20:44.905127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5b9e2d47c1f3'
+down_revision = 'c71f0e5a9d38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows written by the edit form already hold an array literal ('{A,B}');
+    # rows from the create form hold a single genre or a comma separated list.
+    op.alter_column('Artist', 'genres',
+                    existing_type=sa.String(length=120),
+                    type_=postgresql.ARRAY(sa.String()),
+                    postgresql_using='''CASE
+                        WHEN genres LIKE '{%}' THEN genres::varchar[]
+                        ELSE string_to_array(genres, ',')::varchar[]
+                    END''')
+    op.create_index('ix_Artist_genres', 'Artist', ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_Artist_genres', table_name='Artist')
+    op.alter_column('Artist', 'genres',
+                    existing_type=postgresql.ARRAY(sa.String()),
+                    type_=sa.String(length=120),
+                    postgresql_using="array_to_string(genres, ',')")
@@ -0,0 +1,43 @@
+"""denormalized show counters on Venue and Artist
+
+Revision ID: 8d4e61b0a2c5
+Revises: 3f2a9c1d7b10
+Create Date: 2026-10-18 11:02:17.553901
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4e61b0a2c5'
+down_revision = '3f2a9c1d7b10'
+branch_labels = None
+depends_on = None
+
+COUNTED = (('Venue', 'venue_id'), ('Artist', 'artist_id'))
+
+
+def upgrade():
+    for table, show_column in COUNTED:
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(),
+                                       server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(),
+                                       server_default='0', nullable=False))
+        op.execute('''
+            UPDATE "{table}" SET
+                upcoming_shows_count = (
+                    SELECT count(*) FROM "Show"
+                    WHERE "Show".{show_column} = "{table}".id
+                      AND "Show".start_time > timezone('utc', now())),
+                past_shows_count = (
+                    SELECT count(*) FROM "Show"
+                    WHERE "Show".{show_column} = "{table}".id
+                      AND "Show".start_time <= timezone('utc', now()))
+        '''.format(table=table, show_column=show_column))
+
+
+def downgrade():
+    for table, show_column in COUNTED:
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
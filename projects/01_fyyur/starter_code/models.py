@@ -1,13 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import DDL, event
+from fsnd_common.db import configure_engine, register_pool_endpoint
 
 db = SQLAlchemy()
+
+# The name search indexes use trigram operator classes (see search.py).
+event.listen(db.Model.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
 # TODO: connect to a local postgresql database
 def db_setup(app):
     app.config.from_object('config')
+    configure_engine(app)
     db.app = app
     db.init_app(app)
     migrate = Migrate(app, db)
+    register_pool_endpoint(app, db)
     return db
 
 class Venue(db.Model):
@@ -31,6 +39,18 @@ class Venue(db.Model):
     #artists = db.relationship('Artist', secondary = shows, backref = db.backref('venue', lazy = True))
 
     shows = db.relationship('Show', backref = "Venue", lazy = True)
+
+    # Denormalized show counts, maintained by counters.py.
+    upcoming_shows_count = db.Column(db.Integer, nullable = False, default = 0, server_default = '0')
+    past_shows_count = db.Column(db.Integer, nullable = False, default = 0, server_default = '0')
+
+    __table_args__ = (
+        db.Index('ix_Venue_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_state_city', 'state', 'city'),
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+    )
+
 class Artist(db.Model):
     __tablename__ = 'Artist'
 
@@ -39,7 +59,7 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.Column(db.ARRAY(db.String))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
 
@@ -48,9 +68,26 @@ class Artist(db.Model):
     seeking_description = db.Column(db.String(500))
     shows = db.relationship('Show', backref = "Artist", lazy = True)
 
+    # Denormalized show counts, maintained by counters.py.
+    upcoming_shows_count = db.Column(db.Integer, nullable = False, default = 0, server_default = '0')
+    past_shows_count = db.Column(db.Integer, nullable = False, default = 0, server_default = '0')
+
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+    )
+
 class Show(db.Model):
     __tablename__ = 'Show'
     id = db.Column(db.Integer, primary_key = True)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable = False)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable = False)
     start_time = db.Column(db.DateTime, nullable = False)
+
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        # keyset order of the /shows listing
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+    )
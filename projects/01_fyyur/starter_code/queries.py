@@ -0,0 +1,244 @@
+#----------------------------------------------------------------------------#
+# Data access for the Fyyur views.
+#
+# Each loader returns plain dicts shaped exactly like the mock data the
+# templates were written against, so the controllers in app.py only have to
+# pass the result to render_template.
+#----------------------------------------------------------------------------#
+
+from collections import Counter
+from datetime import datetime
+from itertools import groupby
+
+import dateutil.parser
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import joinedload
+
+from models import db, Venue, Artist, Show
+import search
+
+SHOWS_PER_PAGE = 30
+
+
+def _genre_counts(genre_lists):
+    # [(genre, count)] over the listed rows, most common first; the listings
+    # already read every matching row, so counting here saves a query
+    counts = Counter(genre for genres in genre_lists for genre in genres or ())
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+def venue_listing(genres=()):
+    '''
+    venue_listing(genres)
+        (areas, genre_counts) for the venues having every genre in genres:
+        the venues grouped by (city, state), each with its number of
+        upcoming shows read from the counters maintained by counters.py,
+        and [(genre, count)] over those venues, most common first; one query
+    '''
+    query = db.session.query(Venue.city,
+                             Venue.state,
+                             Venue.id,
+                             Venue.name,
+                             Venue.upcoming_shows_count.label('num_upcoming_shows'),
+                             Venue.genres)
+    if genres:
+        query = query.filter(Venue.genres.contains(list(genres)))
+    rows = query.order_by(Venue.state, Venue.city, Venue.name).all()
+
+    areas = []
+    for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+        areas.append({'city': city,
+                      'state': state,
+                      'venues': [{'id': venue.id,
+                                  'name': venue.name,
+                                  'num_upcoming_shows': venue.num_upcoming_shows}
+                                 for venue in venues]})
+    return areas, _genre_counts(row.genres for row in rows)
+
+
+def artist_listing(genres=()):
+    '''
+    artist_listing(genres)
+        (artists, genre_counts): id and name of the artists having every
+        genre in genres, and [(genre, count)] over them; one query
+    '''
+    query = db.session.query(Artist.id, Artist.name, Artist.genres)
+    if genres:
+        query = query.filter(Artist.genres.contains(list(genres)))
+    rows = query.order_by(Artist.name).all()
+    return ([{'id': row.id, 'name': row.name} for row in rows],
+            _genre_counts(row.genres for row in rows))
+
+
+def _split_shows(shows, now, format_show):
+    past, upcoming = [], []
+    for show in sorted(shows, key=lambda show: show.start_time):
+        (upcoming if show.start_time > now else past).append(format_show(show))
+    return past, upcoming
+
+
+def venue_detail(venue_id, now=None):
+    '''
+    venue_detail(venue_id)
+        the show_venue.html template dict, or None for an unknown venue.
+        The venue, its shows and their artists come back in one round trip.
+    '''
+    if now is None:
+        now = datetime.utcnow()
+    venue = Venue.query\
+        .options(joinedload(Venue.shows).joinedload(Show.Artist))\
+        .filter(Venue.id == venue_id)\
+        .one_or_none()
+    if venue is None:
+        return None
+
+    past, upcoming = _split_shows(venue.shows, now, lambda show: {
+        'artist_id': show.artist_id,
+        'artist_name': show.Artist.name,
+        'artist_image_link': show.Artist.image_link,
+        'start_time': show.start_time})
+
+    return {'id': venue.id,
+            'name': venue.name,
+            'genres': venue.genres or [],
+            'address': venue.address,
+            'city': venue.city,
+            'state': venue.state,
+            'phone': venue.phone,
+            'website': venue.website,
+            'facebook_link': venue.facebook_link,
+            'seeking_talent': venue.seeking_talent,
+            'seeking_description': venue.seeking_description,
+            'image_link': venue.image_link,
+            'past_shows': past,
+            'upcoming_shows': upcoming,
+            'past_shows_count': len(past),
+            'upcoming_shows_count': len(upcoming)}
+
+
+def artist_detail(artist_id, now=None):
+    '''
+    artist_detail(artist_id)
+        the show_artist.html template dict, or None for an unknown artist.
+        The artist, its shows and their venues come back in one round trip.
+    '''
+    if now is None:
+        now = datetime.utcnow()
+    artist = Artist.query\
+        .options(joinedload(Artist.shows).joinedload(Show.Venue))\
+        .filter(Artist.id == artist_id)\
+        .one_or_none()
+    if artist is None:
+        return None
+
+    past, upcoming = _split_shows(artist.shows, now, lambda show: {
+        'venue_id': show.venue_id,
+        'venue_name': show.Venue.name,
+        'venue_image_link': show.Venue.image_link,
+        'start_time': show.start_time})
+
+    return {'id': artist.id,
+            'name': artist.name,
+            'genres': artist.genres or [],
+            'city': artist.city,
+            'state': artist.state,
+            'phone': artist.phone,
+            'website': artist.website_link,
+            'facebook_link': artist.facebook_link,
+            'seeking_venue': artist.seeking_venue,
+            'seeking_description': artist.seeking_description,
+            'image_link': artist.image_link,
+            'past_shows': past,
+            'upcoming_shows': upcoming,
+            'past_shows_count': len(past),
+            'upcoming_shows_count': len(upcoming)}
+
+
+def _search_results(model, term, page):
+    total, hits = search.backend_for(model).search(term, page)
+    per_page = search.SEARCH_RESULTS_PER_PAGE
+    return {'count': total,
+            'page': page,
+            'pages': (total + per_page - 1) // per_page,
+            'data': [{'id': id,
+                      'name': name,
+                      'num_upcoming_shows': num_upcoming_shows}
+                     for id, name, num_upcoming_shows in hits]}
+
+
+def venue_search(term, page=1):
+    return _search_results(Venue, term, page)
+
+
+def artist_search(term, page=1):
+    return _search_results(Artist, term, page)
+
+
+def encode_show_cursor(start_time, id):
+    return '{}_{}'.format(start_time.isoformat(), id)
+
+
+def decode_show_cursor(cursor):
+    '''
+    decode_show_cursor('2035-04-01T20:00:00_12')
+        (start_time, id) keyset position; raises ValueError when malformed
+    '''
+    start_time, _, id = cursor.rpartition('_')
+    try:
+        return dateutil.parser.parse(start_time), int(id)
+    except OverflowError:
+        # dateutil raises it for years or offsets out of datetime's range
+        raise ValueError('cursor out of range: {!r}'.format(cursor))
+
+
+def _show_rows(after=None, limit=None):
+    # Columns only: no Show/Venue/Artist instances are built per row.
+    query = db.session.query(Show.id,
+                             Show.start_time,
+                             Show.venue_id,
+                             Venue.name.label('venue_name'),
+                             Show.artist_id,
+                             Artist.name.label('artist_name'),
+                             Artist.image_link.label('artist_image_link'))\
+        .join(Venue, Venue.id == Show.venue_id)\
+        .join(Artist, Artist.id == Show.artist_id)\
+        .order_by(Show.start_time, Show.id)
+    if after is not None:
+        query = query.filter(tuple_(Show.start_time, Show.id) > after)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.yield_per(500)
+
+
+def _format_show_row(row):
+    return {'venue_id': row.venue_id,
+            'venue_name': row.venue_name,
+            'artist_id': row.artist_id,
+            'artist_name': row.artist_name,
+            'artist_image_link': row.artist_image_link,
+            'start_time': row.start_time}
+
+
+def show_page(cursor=None, per_page=SHOWS_PER_PAGE):
+    '''
+    show_page(cursor)
+        (shows, next_cursor) for the page of shows after the keyset cursor,
+        ordered by (start_time, id); next_cursor is None on the last page
+    '''
+    after = decode_show_cursor(cursor) if cursor else None
+    rows = list(_show_rows(after, per_page + 1))
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_show_cursor(rows[-1].start_time, rows[-1].id)
+    return [_format_show_row(row) for row in rows], next_cursor
+
+
+def show_stream():
+    '''
+    show_stream()
+        every show in (start_time, id) order, fetched in batches as the
+        caller iterates, for streamed rendering
+    '''
+    for row in _show_rows():
+        yield _format_show_row(row)
@@ -0,0 +1,235 @@
+#----------------------------------------------------------------------------#
+# Name search for venues and artists.
+#
+# Two interchangeable backends answer the same question -- which rows have a
+# name containing the search term, best matches first:
+#
+#   TrigramSearch        Postgres. ILIKE served by the pg_trgm GIN indexes
+#                        created in migrations/, ranked by similarity().
+#   InvertedIndexSearch  In-process trigram index, for SQLite test runs and
+#                        anywhere pg_trgm is unavailable.
+#
+# The backend is picked from the SEARCH_BACKEND config value, or from the
+# database dialect when it is not set.
+#----------------------------------------------------------------------------#
+
+import threading
+import weakref
+
+from flask import current_app
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, object_session
+
+from models import db
+
+SEARCH_RESULTS_PER_PAGE = 20
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def trigrams(text):
+    text = text.lower()
+    return set(text[i:i + 3] for i in range(max(len(text) - 2, 1)))
+
+
+def similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / float(len(a | b))
+
+
+class TrigramSearch(object):
+    '''
+    TrigramSearch(model)
+        ranked substring search over model.name using pg_trgm;
+        search() returns (total, [(id, name, upcoming_shows_count)])
+    '''
+    def __init__(self, model):
+        self.model = model
+
+    def reset(self):
+        pass
+
+    def search(self, term, page=1, per_page=SEARCH_RESULTS_PER_PAGE):
+        model = self.model
+        pattern = '%{}%'.format(escape_like(term))
+        rows = db.session.query(model.id,
+                                model.name,
+                                model.upcoming_shows_count,
+                                func.count().over().label('total'))\
+            .filter(model.name.ilike(pattern, escape='\\'))\
+            .order_by(func.similarity(model.name, term).desc(), model.name)\
+            .limit(per_page)\
+            .offset((page - 1) * per_page)\
+            .all()
+        if rows:
+            total = rows[0].total
+        else:
+            total = db.session.query(func.count(model.id))\
+                .filter(model.name.ilike(pattern, escape='\\'))\
+                .scalar()
+        return total, [(row.id, row.name, row.upcoming_shows_count) for row in rows]
+
+
+class InvertedIndexSearch(object):
+    '''
+    InvertedIndexSearch(model)
+        ranked substring search over model.name from an in-process
+        trigram -> ids index, kept current by the writes of committed
+        sessions (see _watch below)
+    '''
+    def __init__(self, model):
+        self.model = model
+        self.lock = threading.Lock()
+        self.names = None
+        self.postings = {}
+        _watch(model, self)
+
+    def _load(self):
+        self.names = {}
+        self.postings = {}
+        for row in db.session.query(self.model.id, self.model.name):
+            self._add(row.id, row.name)
+
+    def _add(self, id, name):
+        name = (name or '').lower()
+        self.names[id] = name
+        for gram in trigrams(name):
+            self.postings.setdefault(gram, set()).add(id)
+
+    def _remove(self, id):
+        name = self.names.pop(id, None)
+        if name is None:
+            return
+        for gram in trigrams(name):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(id)
+                if not ids:
+                    del self.postings[gram]
+
+    def reset(self):
+        # Drop the index; it is rebuilt on the next search. Used after bulk
+        # writes that bypass mapper events.
+        with self.lock:
+            self.names = None
+            self.postings = {}
+
+    def apply(self, id, name, deleted):
+        with self.lock:
+            if self.names is not None:
+                self._remove(id)
+                if not deleted:
+                    self._add(id, name)
+
+    def search(self, term, page=1, per_page=SEARCH_RESULTS_PER_PAGE):
+        term = term.lower()
+        grams = trigrams(term)
+        with self.lock:
+            if self.names is None:
+                self._load()
+            if len(term) < 3:
+                candidates = self.names.keys()
+            else:
+                postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+                candidates = set.intersection(*postings) if postings else set()
+            hits = [(id, self.names[id]) for id in candidates
+                    if term in self.names[id]]
+
+        hits.sort(key=lambda hit: (-similarity(grams, trigrams(hit[1])), hit[1]))
+        start = (page - 1) * per_page
+        ids = [id for id, name in hits[start:start + per_page]]
+        if not ids:
+            return len(hits), []
+        rows = db.session.query(self.model.id,
+                                self.model.name,
+                                self.model.upcoming_shows_count)\
+            .filter(self.model.id.in_(ids))
+        found = dict((row.id, row) for row in rows)
+        return len(hits), [tuple(found[id]) for id in ids if id in found]
+
+
+# Writes are collected per session during the flush and applied to every
+# live index of the model once the session commits, so rows of a rolled
+# back transaction are never indexed. The mapper listeners are registered
+# once per model; indexes are held weakly so dropping one frees it.
+_indexes = {}
+
+
+def _watch(model, index):
+    if model not in _indexes:
+        _indexes[model] = weakref.WeakSet()
+        event.listen(model, 'after_insert', _on_write)
+        event.listen(model, 'after_update', _on_write)
+        event.listen(model, 'after_delete', _on_delete)
+    _indexes[model].add(index)
+
+
+def _apply(changes):
+    for model, id, name, deleted in changes:
+        for index in list(_indexes.get(model, ())):
+            index.apply(id, name, deleted)
+
+
+def _record(target, change):
+    session = object_session(target)
+    if session is None:
+        _apply([change])
+    else:
+        session.info.setdefault('search_index_pending', []).append(change)
+
+
+def _on_write(mapper, connection, target):
+    _record(target, (mapper.class_, target.id, target.name, False))
+
+
+def _on_delete(mapper, connection, target):
+    _record(target, (mapper.class_, target.id, None, True))
+
+
+@event.listens_for(Session, 'after_commit')
+def _session_committed(session):
+    changes = session.info.pop('search_index_pending', ())
+    if session.info.pop('search_index_stale', False):
+        # some of the changes were in a rolled back savepoint; which ones is
+        # not tracked, so the affected indexes are rebuilt instead
+        for model in set(change[0] for change in changes):
+            for index in list(_indexes.get(model, ())):
+                index.reset()
+    else:
+        _apply(changes)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _session_rolled_back(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop('search_index_pending', None)
+        session.info.pop('search_index_stale', None)
+    elif session.info.get('search_index_pending'):
+        session.info['search_index_stale'] = True
+
+
+BACKENDS = {'trigram': TrigramSearch,
+            'inverted': InvertedIndexSearch}
+
+_backends = {}
+
+
+def backend_for(model):
+    '''
+    backend_for(model)
+        the search backend for model, created once per process
+    '''
+    if model not in _backends:
+        name = current_app.config.get('SEARCH_BACKEND')
+        if name is None:
+            name = 'trigram' if db.engine.dialect.name == 'postgresql' else 'inverted'
+        _backends[model] = BACKENDS[name](model)
+    return _backends[model]
+
+
+def reset_indexes():
+    for backend in _backends.values():
+        backend.reset()
@@ -0,0 +1,464 @@
+import io
+import json
+import os
+import unittest
+from datetime import datetime, timedelta
+
+# Point the app at the test database before it binds in app.py.
+os.environ.setdefault('DATABASE_URL',
+                      'postgresql://localhost:5432/fyyur_test')
+
+from sqlalchemy import event
+
+from cache import page_cache, RedisCache
+import counters
+import formatting
+import importer
+import queries
+import search
+from app import app
+from models import db, Venue, Artist, Show
+
+
+class QueryCounter(object):
+    """Counts the SQL statements sent to the database inside a with block."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+class FakeRedis(object):
+    """The parts of a redis client RedisCache uses, storing bytes like redis."""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def incr(self, key):
+        value = int(self.values.get(key, b'0')) + 1
+        self.values[key] = str(value).encode()
+        return value
+
+    def scan_iter(self, match):
+        return [key for key in list(self.values) if key.startswith(match.rstrip('*'))]
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and start from an empty database."""
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client = self.app.test_client
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        page_cache.clear()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def seed(self, venues, shows_per_venue=2):
+        artist = Artist(name='Guns N Petals', city='San Francisco',
+                        state='CA')
+        db.session.add(artist)
+        now = datetime.utcnow()
+        for i in range(venues):
+            venue = Venue(name='Venue {}'.format(i),
+                          city='City {}'.format(i % 5), state='CA')
+            db.session.add(venue)
+            for j in range(shows_per_venue):
+                offset = timedelta(days=j + 1)
+                start_time = now + offset if j % 2 == 0 else now - offset
+                db.session.add(Show(Venue=venue, Artist=artist,
+                                    start_time=start_time))
+        db.session.commit()
+        db.session.expunge_all()
+
+    def count_queries(self, path):
+        with QueryCounter(db.engine) as counter:
+            res = self.client().get(path)
+        self.assertEqual(res.status_code, 200)
+        return counter.count
+
+    # Benchmark: /venues must cost the same number of queries at any size
+    def test_venues_query_count_is_constant(self):
+        self.seed(venues=5)
+        small = self.count_queries('/venues')
+        self.seed(venues=200)
+        large = self.count_queries('/venues')
+        self.assertEqual(small, large)
+        self.assertEqual(large, 1)
+
+    def test_venues_groups_by_area_with_upcoming_counts(self):
+        self.seed(venues=10, shows_per_venue=3)
+        areas, genre_counts = queries.venue_listing()
+        self.assertEqual(len(areas), 5)
+        for area in areas:
+            for venue in area['venues']:
+                self.assertEqual(venue['num_upcoming_shows'], 2)
+
+    # Test both name search backends return the same ranked hits
+    def test_name_search_backends(self):
+        for name in ('Guns N Petals', 'Matt Quevado', 'The Wild Sax Band'):
+            db.session.add(Artist(name=name))
+        db.session.commit()
+        for backend in (search.TrigramSearch(Artist),
+                        search.InvertedIndexSearch(Artist)):
+            total, hits = backend.search('A')
+            self.assertEqual(total, 3)
+            total, hits = backend.search('band')
+            self.assertEqual(total, 1)
+            self.assertEqual(hits[0][1], 'The Wild Sax Band')
+
+    # Test the in-process index only takes in committed writes
+    def test_inverted_index_follows_commits(self):
+        index = search.InvertedIndexSearch(Artist)
+        db.session.add(Artist(name='Guns N Petals'))
+        db.session.commit()
+        self.assertEqual(index.search('petals')[0], 1)
+
+        db.session.add(Artist(name='Rolled Back Petals'))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(index.search('petals')[0], 1)
+
+        db.session.add(Artist(name='More Petals'))
+        db.session.commit()
+        self.assertEqual(index.search('petals')[0], 2)
+
+    def test_search_venues_paginates(self):
+        self.seed(venues=search.SEARCH_RESULTS_PER_PAGE + 5)
+        results = queries.venue_search('venue', page=2)
+        self.assertEqual(results['count'], search.SEARCH_RESULTS_PER_PAGE + 5)
+        self.assertEqual(len(results['data']), 5)
+        self.assertEqual(results['data'][0]['num_upcoming_shows'], 1)
+
+    def test_search_clamps_page_below_one(self):
+        self.seed(venues=2)
+        res = self.client().post('/venues/search',
+                                 data={'search_term': 'venue', 'page': 0})
+        self.assertEqual(res.status_code, 200)
+        res = self.client().post('/artists/search',
+                                 data={'search_term': 'guns', 'page': -3})
+        self.assertEqual(res.status_code, 200)
+
+    # Test detail pages cost the same number of queries at any show count
+    def test_detail_pages_query_count_is_constant(self):
+        self.seed(venues=1, shows_per_venue=2)
+        few_venue = self.count_queries('/venues/1')
+        few_artist = self.count_queries('/artists/1')
+        self.seed(venues=1, shows_per_venue=50)
+        many_venue = self.count_queries('/venues/2')
+        many_artist = self.count_queries('/artists/2')
+        self.assertEqual(few_venue, many_venue)
+        self.assertEqual(few_artist, many_artist)
+        self.assertEqual(many_venue, 1)
+
+    def test_venue_detail_splits_past_and_upcoming(self):
+        self.seed(venues=1, shows_per_venue=5)
+        venue = queries.venue_detail(1)
+        self.assertEqual(venue['upcoming_shows_count'], 3)
+        self.assertEqual(venue['past_shows_count'], 2)
+
+    def test_404_unknown_venue(self):
+        res = self.client().get('/venues/1000')
+        self.assertEqual(res.status_code, 404)
+
+    # Test /shows walks every show exactly once through keyset pages
+    def test_shows_keyset_pagination(self):
+        self.seed(venues=1, shows_per_venue=queries.SHOWS_PER_PAGE * 2 + 3)
+        seen = []
+        shows, cursor = queries.show_page()
+        seen.extend(shows)
+        while cursor:
+            shows, cursor = queries.show_page(cursor)
+            seen.extend(shows)
+        self.assertEqual(len(seen), queries.SHOWS_PER_PAGE * 2 + 3)
+        start_times = [show['start_time'] for show in seen]
+        self.assertEqual(start_times, sorted(start_times))
+
+    def test_shows_stream(self):
+        self.seed(venues=2, shows_per_venue=3)
+        res = self.client().get('/shows?stream=1')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_data(as_text=True).count('tile-show'), 6)
+
+    def test_400_shows_bad_cursor(self):
+        res = self.client().get('/shows?after=yesterday')
+        self.assertEqual(res.status_code, 400)
+        res = self.client().get('/shows?after=99999999999999999999_1')
+        self.assertEqual(res.status_code, 400)
+
+    # Test the datetime filter renders datetimes and serves repeats from cache
+    def test_datetime_filter_cache(self):
+        start_time = datetime(2035, 4, 1, 20, 0)
+        before = formatting.cache_stats()
+        first = formatting.format_datetime(start_time, 'full')
+        again = formatting.format_datetime(start_time, 'full')
+        after = formatting.cache_stats()
+        self.assertEqual(first, again)
+        self.assertEqual(first, formatting.format_datetime(str(start_time), 'full'))
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertIn('2035', first)
+
+    # Test the show counters follow inserts, deletes and the rollover job
+    def test_show_counters(self):
+        self.seed(venues=1, shows_per_venue=4)
+        venue = Venue.query.get(1)
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (2, 2))
+
+        db.session.delete(Show.query.filter(Show.start_time > datetime.utcnow()).first())
+        db.session.commit()
+        venue = Venue.query.get(1)
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (1, 2))
+
+        later = datetime.utcnow() + timedelta(days=30)
+        with db.engine.begin() as connection:
+            counters.roll_over(connection, since=datetime.utcnow(), now=later)
+        db.session.expire_all()
+        venue = Venue.query.get(1)
+        artist = Artist.query.get(1)
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (0, 3))
+        self.assertEqual((artist.upcoming_shows_count, artist.past_shows_count), (0, 3))
+
+    # Test deleting a show that started since the last rollover
+    def test_show_counters_delete_before_rollover(self):
+        self.seed(venues=1, shows_per_venue=1)
+        # counted as upcoming, but already started by the time it is deleted
+        with db.engine.begin() as connection:
+            connection.execute(Show.__table__.update().values(
+                start_time=datetime.utcnow() - timedelta(hours=1)))
+        db.session.delete(Show.query.first())
+        db.session.commit()
+        venue = Venue.query.get(1)
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (0, 0))
+
+    # Test cached pages revalidate with ETags and follow model writes
+    def test_page_cache_etag_and_invalidation(self):
+        self.seed(venues=1)
+        first = self.client().get('/venues/1')
+        etag = first.headers['ETag']
+        with QueryCounter(db.engine) as counter:
+            repeat = self.client().get('/venues/1',
+                                       headers={'If-None-Match': etag})
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(counter.count, 0)
+
+        venue = Venue.query.get(1)
+        venue.name = 'The Musical Hop'
+        db.session.commit()
+        res = self.client().get('/venues/1', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('The Musical Hop', res.get_data(as_text=True))
+
+    # Test the shared backend keeps pages and versions apart
+    def test_page_cache_on_redis_backend(self):
+        self.seed(venues=1)
+        backend = page_cache.backend
+        page_cache.backend = RedisCache(client=FakeRedis())
+        self.addCleanup(setattr, page_cache, 'backend', backend)
+        etag = self.client().get('/venues/1').headers['ETag']
+        res = self.client().get('/venues/1', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+        venue = Venue.query.get(1)
+        venue.name = 'The Musical Hop'
+        db.session.commit()
+        self.assertEqual(page_cache.version('venue', 1), 1)
+        res = self.client().get('/venues/1', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('The Musical Hop', res.get_data(as_text=True))
+
+    # Test a rename reaches the pages linked through shows, after commit only
+    def test_page_cache_invalidates_linked_pages_on_commit(self):
+        self.seed(venues=1)
+        self.client().get('/artists/1')
+        self.client().get('/shows')
+
+        version = page_cache.version('shows')
+        venue = Venue.query.get(1)
+        venue.name = 'Not Committed'
+        db.session.flush()
+        self.assertEqual(page_cache.version('shows'), version)
+        db.session.rollback()
+        self.assertNotIn('page_cache_pending', db.session.info)
+
+        venue = Venue.query.get(1)
+        venue.name = 'The Musical Hop'
+        db.session.commit()
+        for path in ('/artists/1', '/shows'):
+            res = self.client().get(path)
+            self.assertIn('The Musical Hop', res.get_data(as_text=True))
+
+    # Test the bulk importer validates rows and reports per-row errors
+    def test_import_venues_csv(self):
+        stream = io.BytesIO(
+            b'name,city,state,address,phone,genres,facebook_link\n'
+            b'The Musical Hop,San Francisco,CA,1015 Folsom Street,123-123-1234,"Jazz,Folk",https://www.facebook.com/TheMusicalHop\n'
+            b'No City,,CA,1 Main Street,,Jazz,https://www.facebook.com/nocity\n'
+            b'The Dueling Pianos Bar,New York,NY,335 Delancey Street,914-003-1132,Classical,https://www.facebook.com/theduelingpianos\n')
+        report = importer.import_file('venues', stream, 'csv', chunk_size=2)
+        self.assertEqual(report.inserted, 2)
+        self.assertEqual(len(report.errors), 1)
+        self.assertEqual(report.errors[0]['line'], 3)
+        self.assertIn('city', report.errors[0]['errors'])
+        self.assertEqual(Venue.query.count(), 2)
+
+    def test_import_shows_upload(self):
+        self.seed(venues=1, shows_per_venue=0)
+        lines = [{'venue_id': 1, 'artist_id': 1, 'start_time': '2035-04-01 20:00:00'},
+                 {'venue_id': 99, 'artist_id': 1, 'start_time': '2035-04-01 20:00:00'}]
+        body = '\n'.join(json.dumps(line) for line in lines).encode()
+        res = self.client().post('/import/shows', data={
+            'file': (io.BytesIO(body), 'shows.json')})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 1)
+        self.assertEqual(data['errors'][0]['line'], 2)
+        self.assertEqual(Venue.query.get(1).upcoming_shows_count, 1)
+
+    def test_import_reports_malformed_json_lines(self):
+        body = (b'{"name": "Guns N Petals", "city": "San Francisco", "state": "CA", '
+                b'"genres": "Rock n Roll", "facebook_link": "https://www.facebook.com/GunsNPetals"}\n'
+                b'{"name": \n'
+                b'5\n')
+        report = importer.import_file('artists', io.BytesIO(body), 'json')
+        self.assertEqual(report.rows, 3)
+        self.assertEqual(report.inserted, 1)
+        self.assertEqual([error['line'] for error in report.errors], [2, 3])
+
+    # Test genre filtering and per-genre counts on the listings
+    def test_genre_facets(self):
+        for name, genres in (('The Musical Hop', ['Jazz', 'Folk']),
+                             ('Park Square Live Music', ['Jazz']),
+                             ('The Dueling Pianos Bar', ['Classical'])):
+            db.session.add(Venue(name=name, city='San Francisco', state='CA',
+                                 genres=genres))
+            db.session.add(Artist(name=name, genres=genres))
+        db.session.commit()
+        for path in ('/venues', '/artists'):
+            res = self.client().get(path + '?genre=Jazz&format=json')
+            data = res.get_json()
+            counts = dict((facet['genre'], facet['count'])
+                          for facet in data['genres'])
+            self.assertEqual(counts, {'Jazz': 2, 'Folk': 1})
+        self.assertEqual(len(data['artists']), 2)
+        res = self.client().get('/venues?genre=Jazz&genre=Folk&format=json')
+        self.assertEqual(len(res.get_json()['areas'][0]['venues']), 1)
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """Fails when a filtered view's query plan falls back to a sequential
+    scan on a large dataset. The full listings (/venues, /artists) read
+    every row by design and are not checked."""
+
+    VENUES = 2000
+    ARTISTS = 2000
+    SHOWS = 50000
+
+    PATHS = ('/venues/{venue_id}', '/artists/{artist_id}', '/shows',
+             '/shows?after={cursor}')
+
+    @classmethod
+    def setUpClass(cls):
+        app.config['TESTING'] = True
+        app.config['PAGE_CACHE_DISABLED'] = True
+        cls.ctx = app.app_context()
+        cls.ctx.push()
+        db.drop_all()
+        db.create_all()
+        now = datetime.utcnow()
+        db.session.execute(Venue.__table__.insert(), [
+            {'name': 'Venue {}'.format(i), 'city': 'City {}'.format(i % 300),
+             'state': 'CA', 'genres': ['Jazz']} for i in range(cls.VENUES)])
+        db.session.execute(Artist.__table__.insert(), [
+            {'name': 'Artist {}'.format(i)} for i in range(cls.ARTISTS)])
+        db.session.execute(Show.__table__.insert(), [
+            {'venue_id': i % cls.VENUES + 1, 'artist_id': i % cls.ARTISTS + 1,
+             'start_time': now + timedelta(hours=i - cls.SHOWS // 2)}
+            for i in range(cls.SHOWS)])
+        db.session.commit()
+        with db.engine.connect() as connection:
+            connection.execution_options(isolation_level='AUTOCOMMIT')\
+                .execute('ANALYZE')
+
+    @classmethod
+    def tearDownClass(cls):
+        app.config['PAGE_CACHE_DISABLED'] = False
+        db.session.remove()
+        db.drop_all()
+        cls.ctx.pop()
+
+    def explain(self, statement, parameters):
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('EXPLAIN ' + statement, parameters)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+        finally:
+            connection.close()
+
+    def test_views_avoid_sequential_scans(self):
+        cursor = queries.show_page(per_page=100)[1]
+        client = app.test_client()
+        for path in self.PATHS:
+            path = path.format(venue_id=self.VENUES // 2,
+                               artist_id=self.ARTISTS // 2,
+                               cursor=cursor)
+            calls = []
+            record = lambda conn, cur, statement, parameters, context, many: \
+                calls.append((statement, parameters))
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                res = client.get(path)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+            self.assertEqual(res.status_code, 200)
+            for statement, parameters in calls:
+                plan = self.explain(statement, parameters)
+                self.assertNotIn('Seq Scan', plan,
+                                 '{} regressed to a sequential scan:\n{}\n{}'
+                                 .format(path, statement, plan))
+
+    def test_search_avoids_sequential_scans(self):
+        statement = str(db.session.query(Venue.id)
+                        .filter(Venue.name.ilike('%Venue 1999%'))
+                        .statement.compile(db.engine,
+                                           compile_kwargs={'literal_binds': True}))
+        self.assertNotIn('Seq Scan', self.explain(statement, {}))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
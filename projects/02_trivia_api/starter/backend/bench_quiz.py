@@ -0,0 +1,49 @@
+"""Quiz selection latency and pool memory from 100 to 1,000,000 questions.
+
+Runs against the in-memory QuestionPool only, no database needed:
+
+    python bench_quiz.py
+"""
+import random
+import timeit
+import tracemalloc
+
+from flaskr.quiz import QuestionPool
+
+SIZES = (100, 10000, 100000, 1000000)
+CATEGORIES = 6
+DIFFICULTIES = 5
+ROUNDS = 20
+PICKS = 10000
+
+
+def rows(size):
+    for id in range(1, size + 1):
+        yield id, id % CATEGORIES + 1, id % DIFFICULTIES + 1
+
+
+def bench(size):
+    tracemalloc.start()
+    # loaded from rows only, never reloaded from a database
+    pool = QuestionPool(ttl=None)
+    pool.load(rows(size))
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    category_ids = [id for id in range(1, size + 1)
+                    if id % CATEGORIES + 1 == 1]
+    previous = set(random.sample(category_ids, min(ROUNDS, len(category_ids) - 1)))
+    pick = timeit.timeit(lambda: pool.pick(1, previous), number=PICKS)
+    pick_near = timeit.timeit(lambda: pool.pick_near(1, 3, previous),
+                              number=PICKS)
+    return (pick / PICKS * 1e6, pick_near / PICKS * 1e6,
+            memory / 2.0**20, memory / 2.0**20 * 1e6 / size)
+
+
+if __name__ == '__main__':
+    print('{:>10}  {:>12}  {:>14}  {:>10}  {:>16}'.format(
+        'questions', 'us per pick', 'us per adaptive', 'pool MiB',
+        'MiB per million'))
+    for size in SIZES:
+        print('{:>10}  {:>12.2f}  {:>14.2f}  {:>10.1f}  {:>16.1f}'.format(
+            size, *bench(size)))
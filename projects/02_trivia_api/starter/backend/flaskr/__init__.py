@@ -1,10 +1,17 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort, jsonify, make_response, Response, \
+    stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 
-from models import setup_db, Question, Category
+from models import setup_db, Question, question_count, \
+    category_question_counts
+from . import bulk
+from .catalog import category_catalog
+from .quiz import question_pool
+from .search import search_questions
+from .quiz_sessions import QuizSession, AdaptiveQuizSession, \
+    MemorySessionStore
 
 QUESTIONS_PER_PAGE = 10
 
@@ -12,8 +19,13 @@ QUESTIONS_PER_PAGE = 10
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
+    if test_config is not None:
+        app.config.from_mapping(test_config)
     setup_db(app)
+    quiz_sessions = app.config.get('QUIZ_SESSION_STORE') or \
+        MemorySessionStore()
     cors = CORS(app, resources={'/': {'origins': '*'}})
+    bulk.register_commands(app)
 
     @app.after_request
     def after_request(response):
@@ -22,37 +34,52 @@ def create_app(test_config=None):
         response.headers.add('Access-Control-Allow-Methods', 'GET, PATCH, POST, DELETE, OPTIONS')
         return response
 
-    def paginate_questions(response, selection):
-        page = response.args.get('page', 1, type=int)
-        start = (page - 1)*QUESTIONS_PER_PAGE
-        end = start + QUESTIONS_PER_PAGE
-        questions = [question.format() for question in selection]
-        current_questions = questions[start:end]
-        return current_questions
+    def page_requested(request):
+        # Writes only send a page of questions back when asked to.
+        return 'page' in request.args or 'after_id' in request.args
+
+    def check_page(request):
+        # Called ahead of the handlers' try blocks, whose except turns any
+        # abort into a 422.
+        if request.args.get('page', 1, type=int) < 1:
+            abort(400)
+
+    def paginate_questions(request, query):
+        # One page of the query, fetched with LIMIT/OFFSET (?page=n) or,
+        # for deep pages, with a keyset cursor (?after_id=<last id seen>).
+        query = query.order_by(Question.id)
+        after_id = request.args.get('after_id', None, type=int)
+        if after_id is not None:
+            query = query.filter(Question.id > after_id)
+        else:
+            check_page(request)
+            page = request.args.get('page', 1, type=int)
+            query = query.offset((page - 1)*QUESTIONS_PER_PAGE)
+        return [question.format()
+                for question in query.limit(QUESTIONS_PER_PAGE)]
 
     @app.route('/categories')
     def get_categories():
-        categories = Category.query.order_by(Category.id).all()
-        if len(categories) == 0:
+        category_list = category_catalog.ordered_types()
+        if len(category_list) == 0:
             abort(404)
-        category_list = []
-        for cat in categories:
-            category_list.append(cat.type)
-        return jsonify({'success': True,
-                        'categories': category_list,
-                        'total_categories': len(categories)})
+        result = {'success': True,
+                  'categories': category_list,
+                  'total_categories': len(category_list)}
+        if request.args.get('with_counts', 0, type=int):
+            # counts change with every question written; not cacheable
+            result['question_counts'] = category_question_counts()
+            return jsonify(result)
+        response = make_response(jsonify(result))
+        response.set_etag(category_catalog.current_etag())
+        return response.make_conditional(request)
 
     @app.route('/questions', methods=['GET'])
     def get_questions():
-        selection = Question.query.order_by(Question.id).all()
-        current_questions = paginate_questions(request, selection)
-        total_questions = len(selection)
+        current_questions = paginate_questions(request, Question.query)
+        total_questions = question_count()
         current_category = None
-        categories = Category.query.all()
-        category_list = []
-
-        for category in categories:
-            category_list.append(category.type)
+        category_list = category_catalog.ordered_types()
 
         return jsonify({'success': True,
                         'questions': current_questions,
@@ -62,20 +89,25 @@ def create_app(test_config=None):
 
     @app.route('/questions/<int:question_id>', methods=['DELETE'])
     def delete_question(question_id):
+        check_page(request)
         try:
-            question = Question.query.filter(Question.id == question_id)\
-                .one_or_none()
+            question = Question.query.get(question_id)
             if question is None:
                 abort(404)
             question.delete()
-            return jsonify({'success': True,
-                            'question_id': question_id,
-                            'total_questions': len(Question.query.all())})
+            result = {'success': True,
+                      'question_id': question_id,
+                      'total_questions': question_count()}
+            if page_requested(request):
+                result['questions'] = paginate_questions(request,
+                                                         Question.query)
+            return jsonify(result)
         except BaseException:
             abort(422)
 
     @app.route('/questions', methods=['POST'])
     def add_question():
+        check_page(request)
         data = request.get_json()
         new_question = data.get('question', None)
         new_answer = data.get('answer', None)
@@ -86,49 +118,80 @@ def create_app(test_config=None):
             if tag:
                 search_term = '%{}%'.format(tag)
                 selection = Question.query\
-                    .filter(Question.question.ilike(search_term))\
-                    .order_by(Question.id).all()
-                if len(selection) == 0:
-                    abort(404)
+                    .filter(Question.question.ilike(search_term))
                 paginated_questions = paginate_questions(request, selection)
+                if len(paginated_questions) == 0:
+                    abort(404)
                 result = jsonify({'success': True,
                                   'current_category': None,
-                                  'total_questions': len(Question.query.all()),
+                                  'total_questions': question_count(),
                                   'questions': paginated_questions})
                 return result
             else:
                 new_question = Question(question=new_question,
                                         answer=new_answer,
-                                        category=new_category,
+                                        category=int(new_category),
                                         difficulty=new_difficulty)
                 Question.insert(new_question)
-                selection = Question.query.order_by(Question.id).all()
-                paginated_questions = paginate_questions(request, selection)
-
-                result = jsonify({'success': True,
-                                  'question_id': new_question.id,
-                                  'total_questions': len(Question.query.all()),
-                                  'questions': paginated_questions})
-                return result
+                result = {'success': True,
+                          'question_id': new_question.id,
+                          'total_questions': question_count()}
+                if page_requested(request):
+                    result['questions'] = paginate_questions(request,
+                                                             Question.query)
+                return jsonify(result)
         except BaseException:
             abort(422)
 
+    @app.route('/questions/search', methods=['GET', 'POST'])
+    def find_questions_by_term():
+        if request.method == 'POST':
+            term = (request.get_json() or {}).get('searchTerm', '')
+        else:
+            term = request.args.get('q', '')
+        term = term.strip()
+        if not term:
+            abort(400)
+        page = request.args.get('page', 1, type=int)
+        if page < 1:
+            abort(400)
+        total, questions = search_questions(term, page, QUESTIONS_PER_PAGE)
+        return jsonify({'success': True,
+                        'current_category': None,
+                        'total_questions': total,
+                        'questions': questions})
+
+    @app.route('/questions/import', methods=['POST'])
+    def import_questions():
+        format = bulk.format_for(request.args.get('filename'),
+                                 request.content_type)
+        chunk_size = request.args.get('chunk_size', bulk.CHUNK_SIZE, type=int)
+        if chunk_size < 1:
+            abort(400)
+        report = bulk.import_rows(bulk.read_rows(request.stream, format),
+                                  chunk_size)
+        return jsonify({'success': True, 'report': report.format()})
+
+    @app.route('/questions/export')
+    def export_questions():
+        return Response(stream_with_context(bulk.export_lines()),
+                        mimetype='application/x-ndjson')
+
     @app.route('/categories/<int:category_id>/questions', methods=['GET'])
     def find_questions(category_id):
+        current_category = category_catalog.type_of(category_id or 1)
+        if current_category is None:
+            abort(404)
+        check_page(request)
         try:
             questions = Question.query.\
-                filter(Question.category == category_id).\
-                all()
-            if category_id != 0:
-                category = Category.query.get(category_id)
-            else:
-                category = Category.query.get(category_id + 1)
-            if questions is None:
-                abort(404)
+                filter(Question.category == category_id)
             formatted_questions = paginate_questions(request, questions)
+            total_questions = category_question_counts([category_id])\
+                .get(category_id, 0)
             return jsonify({'success': True,
-                            'total_questions': len(Question.query.all()),
-                            'current_category': category.type,
+                            'total_questions': total_questions,
+                            'current_category': current_category,
                             'questions': formatted_questions})
         except BaseException:
             abort(422)
@@ -138,28 +201,77 @@ def create_app(test_config=None):
         data = request.get_json()
         if not data:
             abort(400)
-        prev_ques = data['previous_questions']
-        category_id = data['quiz_category']['id']
-        if category_id != 0:
-            if len(prev_ques) == 0:
-                current_q = Question.query.\
-                    filter(Question.category == category_id).\
-                    all()
-            else:
-                current_q = Question.query\
-                    .filter(Question.id == category_id, Question.id.notin_(prev_ques))\
-                    .all()
-        else:
-            if len(prev_ques) == 0:
-                current_q = Question.query.all()
-            else:
-                current_q = Question.query.filter(Question.id.notin_(prev_ques)).all()
-        if len(current_q) == 0:
+        prev_ques = set(data.get('previous_questions', []))
+        try:
+            category_id = int(data['quiz_category']['id'])
+        except (KeyError, TypeError, ValueError):
+            abort(400)
+        if not question_pool.has_category(category_id):
             abort(404)
-        next_ques = random.choice(current_q).format()
+        while True:
+            question_id = question_pool.pick(category_id, prev_ques)
+            if question_id is None:
+                # every question of the category has been played
+                return jsonify({'success': True,
+                                'question': None})
+            question = Question.query.get(question_id)
+            if question is not None:
+                return jsonify({'success': True,
+                                'question': question.format()})
+            # deleted by another process since the pool was loaded
+            question_pool.remove(question_id)
 
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def start_quiz():
+        data = request.get_json()
+        try:
+            category_id = int(data['quiz_category']['id'])
+            mode = data.get('mode', 'standard')
+            difficulty = int(data.get('difficulty', 3))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            abort(400)
+        if mode not in ('standard', 'adaptive'):
+            abort(400)
+        if not question_pool.has_category(category_id):
+            abort(404)
+        if mode == 'adaptive':
+            session = AdaptiveQuizSession(category_id, difficulty)
+        else:
+            session = QuizSession(category_id)
+        quiz_sessions.put(session)
+        total_questions = question_pool.size(category_id)
         return jsonify({'success': True,
-                        'question': next_ques})
+                        'session_id': session.id,
+                        'mode': mode,
+                        'total_questions': total_questions}), 201
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def next_quiz_question(session_id):
+        session = quiz_sessions.get(session_id)
+        if session is None:
+            abort(404)
+        # the answer to the previous question, for adaptive sessions
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            abort(400)
+        if data.get('correct') is not None:
+            session.record(data['correct'])
+        while True:
+            question_id = session.next_id(question_pool)
+            if question_id is None:
+                quiz_sessions.delete(session_id)
+                result = {'success': True, 'question': None}
+                result.update(session.state(question_pool))
+                result['remaining'] = 0
+                return jsonify(result)
+            question = Question.query.get(question_id)
+            if question is not None:
+                quiz_sessions.put(session)
+                result = {'success': True, 'question': question.format()}
+                result.update(session.state(question_pool))
+                return jsonify(result)
+            # deleted by another process since the pool was loaded
+            question_pool.remove(question_id)
 
     @app.errorhandler(404)
     def not_found(error):
@@ -0,0 +1,206 @@
+import codecs
+import csv
+import json
+import time
+from itertools import islice
+
+import click
+
+from models import db, Question, reset_question_count
+from .catalog import category_catalog
+from .quiz import question_pool
+
+'''
+Bulk import and export of questions
+    Imports read CSV (with a question,answer,category,difficulty header) or
+    NDJSON (one question object per line) as a stream and insert the valid
+    rows chunk by chunk, one transaction per chunk. Exports write NDJSON
+    while reading the table in batches, so neither side holds the whole
+    bank in memory.
+
+    flask import-questions bank.ndjson
+    flask export-questions bank.ndjson
+'''
+
+CHUNK_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportReport(object):
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.errors = []
+        self.started = time.time()
+        self.elapsed = 0.0
+
+    def error(self, line, message):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def finish(self):
+        self.elapsed = time.time() - self.started
+
+    def format(self):
+        return {'rows': self.rows,
+                'inserted': self.inserted,
+                'failed': self.rows - self.inserted,
+                'errors': self.errors,
+                'elapsed': round(self.elapsed, 3)}
+
+
+def format_for(filename, content_type=None):
+    if content_type and content_type.startswith('text/csv'):
+        return 'csv'
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    return 'ndjson'
+
+
+def read_rows(stream, format):
+    '''
+    read_rows(stream, 'csv')
+        (line number, row dict) for every record in a binary or text stream
+    '''
+    if isinstance(stream.read(0), bytes):
+        stream = codecs.getreader('utf-8')(stream)
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, None
+
+
+def question_values(row):
+    '''
+    question_values(row)
+        the column values of a question row; raises ValueError when the row
+        is not a valid question
+    '''
+    if not isinstance(row, dict):
+        raise ValueError('not a question object')
+    values = {}
+    for field in ('question', 'answer'):
+        value = row.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError('{} is required'.format(field))
+        values[field] = value.strip()
+    try:
+        values['category'] = int(row.get('category'))
+        values['difficulty'] = int(row.get('difficulty'))
+    except (TypeError, ValueError):
+        raise ValueError('category and difficulty must be integers')
+    if not 1 <= values['difficulty'] <= 5:
+        raise ValueError('difficulty must be between 1 and 5')
+    return values
+
+
+def _unknown_categories(valid):
+    return set(values['category'] for line, values in valid
+               if category_catalog.type_of(values['category']) is None)
+
+
+def import_rows(rows, chunk_size=CHUNK_SIZE):
+    '''
+    import_rows(read_rows(stream, 'csv'))
+        validates and inserts (line number, row) pairs chunk by chunk and
+        returns an ImportReport
+    '''
+    report = ImportReport()
+    rows = iter(rows)
+    catalog_reloaded = False
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        valid = []
+        for line, row in chunk:
+            report.rows += 1
+            try:
+                valid.append((line, question_values(row)))
+            except ValueError as e:
+                report.error(line, str(e))
+
+        # A row with an unknown category would fail the whole chunk on the
+        # foreign key; check them against the catalog up front, reloading
+        # it once in case the category was added by another process.
+        unknown = _unknown_categories(valid)
+        if unknown and not catalog_reloaded:
+            category_catalog.bump()
+            catalog_reloaded = True
+            unknown = _unknown_categories(valid)
+        checked = []
+        for line, values in valid:
+            if values['category'] in unknown:
+                report.error(line, 'no category {}'.format(values['category']))
+            else:
+                checked.append((line, values))
+        valid = checked
+
+        if not valid:
+            continue
+        try:
+            db.session.execute(Question.__table__.insert(),
+                               [values for line, values in valid])
+            db.session.commit()
+            report.inserted += len(valid)
+        except Exception as e:
+            db.session.rollback()
+            for line, values in valid:
+                report.error(line, 'chunk not inserted: {}'.format(e))
+
+    # core inserts skip the mapper events that keep the cached count and
+    # the quiz pool current
+    if report.inserted:
+        reset_question_count()
+        # the imported rows get ids above the pool's highest, so a top-up
+        # picks them up without reloading the whole table
+        question_pool.expire()
+    report.finish()
+    return report
+
+
+def export_lines(batch_size=EXPORT_BATCH_SIZE):
+    '''
+    export_lines()
+        every question as an NDJSON line, in id order, read from a
+        server-side cursor batch_size rows at a time
+    '''
+    query = db.session.query(Question.id, Question.question,
+                             Question.answer, Question.category,
+                             Question.difficulty)\
+        .order_by(Question.id).yield_per(batch_size)
+    for row in query:
+        yield json.dumps(row._asdict()) + '\n'
+
+
+def register_commands(app):
+    @app.cli.command('import-questions')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--chunk-size', default=CHUNK_SIZE, show_default=True)
+    def import_command(path, chunk_size):
+        """Bulk load questions from a CSV or NDJSON file."""
+        with open(path, 'rb') as stream:
+            report = import_rows(read_rows(stream, format_for(path)),
+                                 chunk_size)
+        for error in report.errors:
+            click.echo('line {}: {}'.format(error['line'], error['error']),
+                       err=True)
+        click.echo('{} rows, {} inserted, {} failed in {:.1f}s'.format(
+            report.rows, report.inserted, report.rows - report.inserted,
+            report.elapsed))
+
+    @app.cli.command('export-questions')
+    @click.argument('path', type=click.Path(dir_okay=False), default='-')
+    def export_command(path):
+        """Write every question to an NDJSON file (default stdout)."""
+        with click.open_file(path, 'w') as out:
+            for line in export_lines():
+                out.write(line)
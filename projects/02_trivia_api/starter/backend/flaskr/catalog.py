@@ -0,0 +1,71 @@
+import hashlib
+import threading
+
+from sqlalchemy import event
+
+from models import db, Category
+
+'''
+CategoryCatalog
+    the categories table, loaded once and kept until a Category insert,
+    update or delete in this process bumps the version. Category writes are
+    rare, so the listing and id lookups of every request are answered from
+    memory.
+'''
+
+
+class CategoryCatalog(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = 0
+        self.loaded_version = None
+        self.types = []
+        self.by_id = {}
+        self.etag = None
+
+    def bump(self):
+        with self.lock:
+            self.version += 1
+
+    def ensure_loaded(self):
+        with self.lock:
+            if self.loaded_version == self.version:
+                return
+            version = self.version
+        rows = db.session.query(Category.id, Category.type)\
+            .order_by(Category.id).all()
+        by_id = dict(rows)
+        types = [type for id, type in rows]
+        digest = hashlib.sha1(repr(rows).encode('utf-8')).hexdigest()
+        with self.lock:
+            self.by_id = by_id
+            self.types = types
+            self.etag = 'categories-{}'.format(digest[:16])
+            # a write that landed while loading is picked up next call
+            self.loaded_version = version
+
+    def ordered_types(self):
+        '''
+        ordered_types()
+            the category types in id order, as the frontend lists them
+        '''
+        self.ensure_loaded()
+        return list(self.types)
+
+    def type_of(self, category_id):
+        self.ensure_loaded()
+        return self.by_id.get(category_id)
+
+    def current_etag(self):
+        self.ensure_loaded()
+        return self.etag
+
+
+category_catalog = CategoryCatalog()
+
+
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def category_changed(*args):
+    category_catalog.bump()
@@ -0,0 +1,271 @@
+import random
+import threading
+import time
+
+from sqlalchemy import event
+
+from models import db, Question
+
+ALL_CATEGORIES = 0
+DIFFICULTIES = range(1, 6)
+
+# Random draws tried before falling back to scanning a bucket for the ids
+# not yet played; only reached when a quiz has used up most of a category.
+MAX_DRAWS = 32
+
+# Seconds between top-ups of the pool with the questions written by other
+# processes (and their bulk imports), whose events this process never sees.
+QUESTION_POOL_TTL = 60
+# Ids below the highest one loaded that a top-up reads again, for rows whose
+# transaction committed after a row with a higher id was already loaded.
+TOP_UP_OVERLAP = 1000
+
+
+'''
+IdBucket
+    a list of question ids with O(1) add, remove and random pick
+'''
+
+
+class IdBucket(object):
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, id):
+        if id not in self.positions:
+            self.positions[id] = len(self.ids)
+            self.ids.append(id)
+
+    def remove(self, id):
+        position = self.positions.pop(id, None)
+        if position is None:
+            return
+        last = self.ids.pop()
+        if position < len(self.ids):
+            self.ids[position] = last
+            self.positions[last] = position
+
+    def pick(self, exclude=(), rng=random):
+        '''
+        pick(exclude)
+            a random id not in exclude, or None when every id is excluded
+        '''
+        if not self.ids:
+            return None
+        for _ in range(MAX_DRAWS):
+            id = self.ids[rng.randrange(len(self.ids))]
+            if id not in exclude:
+                return id
+        remaining = [id for id in self.ids if id not in exclude]
+        if not remaining:
+            return None
+        return rng.choice(remaining)
+
+
+'''
+QuestionPool
+    the ids of every question, by category and by (category, difficulty),
+    loaded from the database once and kept current by Question insert and
+    delete events. Every ttl seconds (never when None) one request tops the
+    pool up with the rows above the highest id loaded, which costs the new
+    rows only; other requests keep picking from the pool meanwhile.
+    Questions deleted by other processes are dropped when picked. Picking
+    the next quiz question is then a random draw plus a primary key fetch
+    instead of loading every candidate row.
+'''
+
+
+class QuestionPool(object):
+    def __init__(self, ttl=QUESTION_POOL_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.categories = None
+        self.everything = IdBucket()
+        self.by_difficulty = {}
+        self.max_id = 0
+        self.expires = 0
+        self.load_lock = threading.Lock()
+
+    @staticmethod
+    def category_key(category):
+        try:
+            return int(category)
+        except (TypeError, ValueError):
+            return category
+
+    def load(self, rows):
+        '''
+        load(rows)
+            replaces the pool with (id, category, difficulty) rows
+        '''
+        categories = {}
+        everything = IdBucket()
+        by_difficulty = {}
+        max_id = 0
+        for id, category, difficulty in rows:
+            max_id = max(max_id, id)
+            key = self.category_key(category)
+            categories.setdefault(key, IdBucket()).add(id)
+            everything.add(id)
+            for bucket_key in ((key, difficulty),
+                               (ALL_CATEGORIES, difficulty)):
+                by_difficulty.setdefault(bucket_key, IdBucket()).add(id)
+        with self.lock:
+            self.categories = categories
+            self.everything = everything
+            self.by_difficulty = by_difficulty
+            self.max_id = max_id
+            self._schedule_top_up()
+
+    def _schedule_top_up(self):
+        self.expires = (time.time() + self.ttl if self.ttl is not None
+                        else float('inf'))
+
+    def top_up(self, rows):
+        '''
+        top_up(rows)
+            adds (id, category, difficulty) rows to the loaded pool
+        '''
+        for id, category, difficulty in rows:
+            self.add(id, category, difficulty)
+        with self.lock:
+            self._schedule_top_up()
+
+    def _query(self, after_id=None):
+        query = db.session.query(Question.id, Question.category,
+                                 Question.difficulty)
+        if after_id is not None:
+            query = query.filter(Question.id > after_id)
+        return query
+
+    def ensure_loaded(self):
+        if self.categories is None:
+            with self.load_lock:
+                if self.categories is None:
+                    self.load(self._query())
+            return
+        # only the request that takes the lock tops up; the rest carry on
+        # with the pool as it is
+        if time.time() >= self.expires and self.load_lock.acquire(False):
+            try:
+                if time.time() >= self.expires:
+                    self.top_up(self._query(self.max_id - TOP_UP_OVERLAP))
+            finally:
+                self.load_lock.release()
+
+    def reset(self):
+        with self.lock:
+            self.categories = None
+            self.everything = IdBucket()
+            self.by_difficulty = {}
+            self.max_id = 0
+
+    def expire(self):
+        '''
+        expire()
+            makes the next request top the pool up, e.g. after rows were
+            inserted without mapper events
+        '''
+        with self.lock:
+            self.expires = 0
+
+    def add(self, id, category, difficulty=None):
+        with self.lock:
+            if self.categories is None:
+                return
+            key = self.category_key(category)
+            self.categories.setdefault(key, IdBucket()).add(id)
+            self.everything.add(id)
+            for bucket_key in ((key, difficulty),
+                               (ALL_CATEGORIES, difficulty)):
+                self.by_difficulty.setdefault(bucket_key, IdBucket()).add(id)
+            self.max_id = max(self.max_id, id)
+
+    def remove(self, id, category=None, difficulty=None):
+        with self.lock:
+            if self.categories is None:
+                return
+            if category is None:
+                buckets = list(self.categories.values())
+            else:
+                buckets = [self.categories.get(self.category_key(category),
+                                               IdBucket())]
+            if category is None or difficulty is None:
+                buckets.extend(self.by_difficulty.values())
+            else:
+                buckets.extend(
+                    self.by_difficulty.get(bucket_key, IdBucket())
+                    for bucket_key in ((self.category_key(category),
+                                        difficulty),
+                                       (ALL_CATEGORIES, difficulty)))
+            for bucket in buckets:
+                bucket.remove(id)
+            self.everything.remove(id)
+
+    def size(self, category):
+        self.ensure_loaded()
+        with self.lock:
+            if category == ALL_CATEGORIES:
+                return len(self.everything)
+            bucket = self.categories.get(self.category_key(category))
+            return len(bucket) if bucket is not None else 0
+
+    def has_category(self, category):
+        self.ensure_loaded()
+        return (category == ALL_CATEGORIES or
+                self.category_key(category) in self.categories)
+
+    def pick(self, category, exclude=()):
+        '''
+        pick(category, previous_questions)
+            a random question id of the category (0 for all categories)
+            that is not in exclude, or None when none is left
+        '''
+        self.ensure_loaded()
+        with self.lock:
+            if category == ALL_CATEGORIES:
+                bucket = self.everything
+            else:
+                bucket = self.categories.get(self.category_key(category))
+            if bucket is None:
+                return None
+            return bucket.pick(exclude)
+
+    def pick_near(self, category, difficulty, exclude=()):
+        '''
+        pick_near(category, difficulty, exclude)
+            a random question id of the category at the given difficulty,
+            or at the nearest difficulty that has one left, trying the
+            easier side first on ties; None when none is left
+        '''
+        self.ensure_loaded()
+        key = (ALL_CATEGORIES if category == ALL_CATEGORIES
+               else self.category_key(category))
+        nearest = sorted(DIFFICULTIES,
+                         key=lambda level: (abs(level - difficulty), level))
+        with self.lock:
+            for level in nearest:
+                bucket = self.by_difficulty.get((key, level))
+                if bucket is None:
+                    continue
+                id = bucket.pick(exclude)
+                if id is not None:
+                    return id
+            return None
+
+
+question_pool = QuestionPool()
+
+
+@event.listens_for(Question, 'after_insert')
+def _question_inserted(mapper, connection, target):
+    question_pool.add(target.id, target.category, target.difficulty)
+
+
+@event.listens_for(Question, 'after_delete')
+def _question_deleted(mapper, connection, target):
+    question_pool.remove(target.id, target.category, target.difficulty)
@@ -0,0 +1,126 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+'''
+QuizSession
+    a quiz in progress: random questions of its category drawn from the
+    pool, leaving out the ones already asked. The session keeps only the
+    asked ids, so it grows with the questions played rather than with the
+    size of the category.
+'''
+
+
+class QuizSession(object):
+    def __init__(self, category, id=None):
+        self.id = id or uuid.uuid4().hex
+        self.category = category
+        self.asked = set()
+
+    def next_id(self, pool):
+        id = pool.pick(self.category, self.asked)
+        if id is not None:
+            self.asked.add(id)
+        return id
+
+    def record(self, correct):
+        pass
+
+    def state(self, pool):
+        return {'remaining': max(pool.size(self.category) - len(self.asked),
+                                 0)}
+
+
+'''
+AdaptiveQuizSession
+    a quiz that serves questions near a target difficulty and moves the
+    target with the player's accuracy over the last ADAPT_WINDOW answers:
+    up a level at ADAPT_UP or better, down a level at ADAPT_DOWN or worse.
+    Questions come from the pool's (category, difficulty) buckets, so the
+    session keeps only the ids already asked.
+'''
+ADAPT_WINDOW = 4
+ADAPT_UP = 0.75
+ADAPT_DOWN = 0.25
+
+
+class AdaptiveQuizSession(object):
+    def __init__(self, category, difficulty=3, id=None):
+        self.id = id or uuid.uuid4().hex
+        self.category = category
+        self.difficulty = min(max(int(difficulty), 1), 5)
+        self.asked = set()
+        self.answers = deque(maxlen=ADAPT_WINDOW)
+        self.answered = 0
+        self.correct = 0
+
+    def next_id(self, pool):
+        id = pool.pick_near(self.category, self.difficulty, self.asked)
+        if id is not None:
+            self.asked.add(id)
+        return id
+
+    def record(self, correct):
+        correct = bool(correct)
+        self.answered += 1
+        self.correct += correct
+        self.answers.append(correct)
+        if len(self.answers) < ADAPT_WINDOW:
+            return
+        accuracy = sum(self.answers) / float(len(self.answers))
+        if accuracy >= ADAPT_UP and self.difficulty < 5:
+            self.difficulty += 1
+            self.answers.clear()
+        elif accuracy <= ADAPT_DOWN and self.difficulty > 1:
+            self.difficulty -= 1
+            self.answers.clear()
+
+    def state(self, pool):
+        return {'remaining': max(pool.size(self.category) - len(self.asked),
+                                 0),
+                'difficulty': self.difficulty,
+                'accuracy': (round(self.correct / float(self.answered), 3)
+                             if self.answered else None)}
+
+
+'''
+MemorySessionStore
+    quiz sessions kept in this process, at most maxsize of them (least
+    recently used are dropped first) and each for at most ttl seconds after
+    its last use. Any object with the same get/put/delete methods can be
+    passed to create_app as QUIZ_SESSION_STORE instead, e.g. one backed by a
+    store shared between workers.
+'''
+
+
+class MemorySessionStore(object):
+    def __init__(self, maxsize=10000, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, id):
+        with self.lock:
+            entry = self.sessions.get(id)
+            if entry is None:
+                return None
+            session, expires = entry
+            if expires < time.time():
+                del self.sessions[id]
+                return None
+            self.sessions[id] = (session, time.time() + self.ttl)
+            self.sessions.move_to_end(id)
+            return session
+
+    def put(self, session):
+        with self.lock:
+            self.sessions[session.id] = (session, time.time() + self.ttl)
+            self.sessions.move_to_end(session.id)
+            while len(self.sessions) > self.maxsize:
+                self.sessions.popitem(last=False)
+
+    def delete(self, id):
+        with self.lock:
+            self.sessions.pop(id, None)
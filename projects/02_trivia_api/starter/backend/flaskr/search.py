@@ -0,0 +1,122 @@
+import threading
+
+from sqlalchemy import text
+
+from models import db
+
+'''
+Full-text question search
+    Postgres keeps a generated tsvector column over question and answer
+    text with a GIN index, shipped in trivia.psql and added to older
+    databases by migrate_search.sql; SQLite (local runs and tests) keeps an
+    FTS5 table synced by triggers, created on first use. Either way matches
+    are ranked, counted and paginated in the database.
+'''
+
+POSTGRES_CHECK = text(
+    "SELECT 1 FROM information_schema.columns"
+    " WHERE table_name = 'questions' AND column_name = 'search_vector'")
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5("
+    "question, answer, content='questions', content_rowid='id',"
+    " tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS questions_fts_insert AFTER INSERT"
+    " ON questions BEGIN INSERT INTO questions_fts(rowid, question, answer)"
+    " VALUES (new.id, new.question, new.answer); END",
+    "CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE"
+    " ON questions BEGIN INSERT INTO questions_fts(questions_fts, rowid,"
+    " question, answer) VALUES ('delete', old.id, old.question, old.answer);"
+    " END",
+    "CREATE TRIGGER IF NOT EXISTS questions_fts_update AFTER UPDATE"
+    " ON questions BEGIN INSERT INTO questions_fts(questions_fts, rowid,"
+    " question, answer) VALUES ('delete', old.id, old.question, old.answer);"
+    " INSERT INTO questions_fts(rowid, question, answer)"
+    " VALUES (new.id, new.question, new.answer); END",
+    "INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_COUNT = text(
+    "SELECT count(*) FROM questions"
+    " WHERE search_vector @@ websearch_to_tsquery('english', :term)")
+POSTGRES_PAGE = text(
+    "SELECT id, question, answer, category, difficulty FROM questions,"
+    " websearch_to_tsquery('english', :term) AS query"
+    " WHERE search_vector @@ query"
+    " ORDER BY ts_rank(search_vector, query) DESC, id"
+    " LIMIT :limit OFFSET :offset")
+
+SQLITE_COUNT = text(
+    "SELECT count(*) FROM questions_fts WHERE questions_fts MATCH :term")
+SQLITE_PAGE = text(
+    "SELECT q.id, q.question, q.answer, q.category, q.difficulty"
+    " FROM questions_fts JOIN questions AS q ON q.id = questions_fts.rowid"
+    " WHERE questions_fts MATCH :term"
+    " ORDER BY bm25(questions_fts), q.id"
+    " LIMIT :limit OFFSET :offset")
+
+_installed = set()
+_install_lock = threading.Lock()
+
+
+def install_search(engine):
+    '''
+    install_search(engine)
+        creates the FTS5 table and triggers on a SQLite database, or checks
+        that migrate_search.sql has been applied to a Postgres one; once per
+        database per process
+    '''
+    key = str(engine.url)
+    with _install_lock:
+        if key in _installed:
+            return
+        if engine.dialect.name == 'postgresql':
+            # the column rewrites the table when added, which is not
+            # something to do inside a request
+            with engine.connect() as connection:
+                if connection.execute(POSTGRES_CHECK).scalar() is None:
+                    raise RuntimeError('questions.search_vector is missing;'
+                                       ' run migrate_search.sql')
+        elif engine.dialect.name == 'sqlite':
+            with engine.begin() as connection:
+                for statement in SQLITE_DDL:
+                    connection.execute(text(statement))
+        else:
+            raise RuntimeError('full-text search needs postgresql or sqlite')
+        _installed.add(key)
+
+
+def sqlite_match(term):
+    # FTS5 has its own query syntax; quote each word so user input is
+    # always searched for as plain text
+    words = ['"{}"'.format(word.replace('"', '""')) for word in term.split()]
+    return ' '.join(words)
+
+
+def search_questions(term, page, per_page):
+    '''
+    search_questions(term, page, per_page)
+        (total, questions) for one page of the questions matching term,
+        best matches first
+    '''
+    engine = db.get_engine()
+    install_search(engine)
+    if engine.dialect.name == 'postgresql':
+        count, select = POSTGRES_COUNT, POSTGRES_PAGE
+    else:
+        count, select = SQLITE_COUNT, SQLITE_PAGE
+        term = sqlite_match(term)
+    if not term:
+        return 0, []
+    params = {'term': term}
+    total = db.session.execute(count, params).scalar()
+    if total == 0:
+        return 0, []
+    params.update(limit=per_page, offset=(page - 1)*per_page)
+    questions = [{'id': row.id,
+                  'question': row.question,
+                  'answer': row.answer,
+                  'category': row.category,
+                  'difficulty': row.difficulty}
+                 for row in db.session.execute(select, params)]
+    return total, questions
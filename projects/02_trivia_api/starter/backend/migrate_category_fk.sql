@@ -0,0 +1,17 @@
+-- Brings a trivia database created before questions.category was an
+-- indexed integer foreign key up to date. Safe to run more than once:
+--   psql trivia < migrate_category_fk.sql
+BEGIN;
+
+ALTER TABLE questions
+    ALTER COLUMN category TYPE integer USING NULLIF(category::text, '')::integer;
+
+ALTER TABLE questions DROP CONSTRAINT IF EXISTS category;
+ALTER TABLE questions DROP CONSTRAINT IF EXISTS questions_category_fkey;
+ALTER TABLE questions
+    ADD CONSTRAINT questions_category_fkey FOREIGN KEY (category)
+    REFERENCES categories(id) ON UPDATE CASCADE ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS ix_questions_category ON questions (category);
+
+COMMIT;
@@ -0,0 +1,13 @@
+-- Adds the full-text search column and index used by /questions/search to
+-- a trivia database restored from an older copy of trivia.psql. Needs
+-- Postgres 12 or later. Adding the generated column rewrites the table, so
+-- run it once, outside busy hours; it is safe to run more than once:
+--   psql trivia < migrate_search.sql
+ALTER TABLE questions
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('english',
+        coalesce(question, '') || ' ' || coalesce(answer, ''))) STORED;
+
+-- Not in a transaction: CREATE INDEX CONCURRENTLY cannot run inside one.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_questions_search_vector
+    ON questions USING gin (search_vector);
@@ -1,6 +1,9 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import time
+from sqlalchemy import Column, String, Integer, ForeignKey, create_engine, \
+    event, func
 from flask_sqlalchemy import SQLAlchemy
+from fsnd_common.db import configure_engine, register_pool_endpoint
 import json
 
 database_name = "trivia"
@@ -17,8 +20,10 @@ setup_db(app)
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    configure_engine(app)
     db.app = app
     db.init_app(app)
+    register_pool_endpoint(app, db)
     db.create_all()
 
 
@@ -32,7 +37,10 @@ class Question(db.Model):
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey('categories.id',
+                                          onupdate='CASCADE',
+                                          ondelete='SET NULL'),
+                      index=True)
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
@@ -78,3 +86,60 @@ class Category(db.Model):
             return {'id': self.id,
                     'type': self.type
                     }
+
+
+'''
+category_question_counts(category_ids)
+    {category id: number of questions} for the given categories, or for
+    every category when none are given, from one grouped LEFT JOIN so
+    that categories without questions count 0
+'''
+
+
+def category_question_counts(category_ids=None):
+    query = db.session.query(Category.id, func.count(Question.id))\
+        .outerjoin(Question, Question.category == Category.id)\
+        .group_by(Category.id)
+    if category_ids is not None:
+        query = query.filter(Category.id.in_(category_ids))
+    return dict(query)
+
+
+'''
+question_count()
+    COUNT(*) of the questions table, counted once and then kept by adding
+    or subtracting the questions inserted or deleted in this process. A
+    rollback drops it, and it is recounted at least every
+    QUESTION_COUNT_TTL seconds to pick up writes made by other processes.
+'''
+QUESTION_COUNT_TTL = 60
+_question_count = None
+_question_count_expires = 0
+
+
+def question_count():
+    global _question_count, _question_count_expires
+    if _question_count is None or time.time() > _question_count_expires:
+        _question_count = db.session.query(func.count(Question.id)).scalar()
+        _question_count_expires = time.time() + QUESTION_COUNT_TTL
+    return _question_count
+
+
+@event.listens_for(Question, 'after_insert')
+def _question_inserted(*args):
+    global _question_count
+    if _question_count is not None:
+        _question_count += 1
+
+
+@event.listens_for(Question, 'after_delete')
+def _question_deleted(*args):
+    global _question_count
+    if _question_count is not None:
+        _question_count -= 1
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def reset_question_count(*args):
+    global _question_count
+    _question_count = None
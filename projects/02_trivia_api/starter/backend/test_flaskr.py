@@ -2,9 +2,13 @@ import os
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
 from flaskr import create_app
 from models import setup_db, Question, Category
+from flaskr.quiz import QuestionPool
+from flaskr.quiz_sessions import QuizSession, AdaptiveQuizSession, \
+    ADAPT_WINDOW
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -38,6 +42,13 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['total_categories'])
 
+    def test_get_categories_not_modified(self):
+        res = self.client().get('/categories')
+        self.assertTrue(res.headers.get('ETag'))
+        res = self.client().get('/categories', headers={
+            'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+
     # Test get questions endpoint
     def test_get_questions(self):
         res = self.client().get('/questions')
@@ -46,6 +57,34 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['total_questions'])
 
+    def test_get_questions_after_id(self):
+        first = json.loads(self.client().get('/questions').data)
+        last_id = first['questions'][-1]['id']
+        res = self.client().get('/questions?after_id={}'.format(last_id))
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], first['total_questions'])
+        self.assertTrue(all(question['id'] > last_id
+                            for question in data['questions']))
+
+    def test_get_questions_past_last_page(self):
+        res = self.client().get('/questions?page=100000')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'], [])
+
+    def test_400_get_questions_page_below_one(self):
+        for page in (0, -1):
+            res = self.client().get('/questions?page={}'.format(page))
+            self.assertEqual(res.status_code, 400)
+        res = self.client().post('/questions?page=0',
+                                 json={'question': 'Not added?',
+                                       'answer': 'No', 'category': 1,
+                                       'difficulty': 1})
+        self.assertEqual(res.status_code, 400)
+        res = self.client().delete('/questions/1?page=0')
+        self.assertEqual(res.status_code, 400)
+
     # Test delete functionality of /questions/<int: question_id> endpoint
     def test_delete_question(self):
         res = self.client().post('/questions', json={'question': 'What?',
@@ -77,6 +116,45 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['total_questions'])
 
+    def count_loaded_questions(self, request):
+        loaded = []
+
+        def on_load(target, context):
+            loaded.append(target.id)
+        event.listen(Question, 'load', on_load)
+        try:
+            res = request()
+        finally:
+            event.remove(Question, 'load', on_load)
+        return res, len(loaded)
+
+    def test_writes_load_no_question_rows(self):
+        # warm the cached question count
+        self.client().get('/questions')
+        res, loaded = self.count_loaded_questions(
+            lambda: self.client().post('/questions', json={
+                'question': 'Cheap write?', 'answer': 'Yes',
+                'category': 1, 'difficulty': 1}))
+        data = json.loads(res.data)
+        self.assertEqual(loaded, 0)
+        self.assertNotIn('questions', data)
+
+        res, loaded = self.count_loaded_questions(
+            lambda: self.client().delete(
+                '/questions/{}'.format(data['question_id'])))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(loaded, 1)
+
+    def test_write_returns_requested_page(self):
+        res, loaded = self.count_loaded_questions(
+            lambda: self.client().post('/questions?page=1', json={
+                'question': 'Paged write?', 'answer': 'Yes',
+                'category': 1, 'difficulty': 1}))
+        data = json.loads(res.data)
+        self.assertTrue(data['questions'])
+        self.assertLessEqual(loaded, len(data['questions']))
+        self.client().delete('/questions/{}'.format(data['question_id']))
+
     def test_422_add_question_failure(self):
         res = self.client().post('/questions', json={'question': 10,
                                                      'answer': 10,
@@ -97,6 +175,83 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(res.status_code, 422)
 
+    # Test /questions/search endpoint
+    def test_full_text_search(self):
+        res = self.client().post('/questions/search',
+                                 json={'searchTerm': 'actor'})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['questions'])
+        self.assertEqual(data['total_questions'], len(data['questions']))
+        res = self.client().get('/questions/search?q=actor')
+        self.assertEqual(json.loads(res.data)['questions'], data['questions'])
+
+    def test_full_text_search_no_match(self):
+        res = self.client().get('/questions/search?q=Godzia')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], 0)
+        self.assertEqual(data['questions'], [])
+
+    def test_400_full_text_search_empty_term(self):
+        res = self.client().get('/questions/search?q=')
+        self.assertEqual(res.status_code, 400)
+
+    # Test /questions/import and /questions/export endpoints
+    def test_import_and_export_questions(self):
+        rows = [{'question': 'Bulk question one?', 'answer': 'One',
+                 'category': 1, 'difficulty': 1},
+                {'question': '', 'answer': 'Missing question',
+                 'category': 1, 'difficulty': 1},
+                {'question': 'Bulk question two?', 'answer': 'Two',
+                 'category': 2, 'difficulty': 6}]
+        body = '\n'.join(json.dumps(row) for row in rows)
+        res = self.client().post('/questions/import', data=body,
+                                 content_type='application/x-ndjson')
+        report = json.loads(res.data)['report']
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(report['rows'], 3)
+        self.assertEqual(report['inserted'], 1)
+        self.assertEqual([error['line'] for error in report['errors']],
+                         [2, 3])
+
+        res = self.client().get('/questions/export')
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        exported = [json.loads(line)
+                    for line in res.get_data(as_text=True).splitlines()]
+        imported = [row for row in exported
+                    if row['question'] == 'Bulk question one?']
+        self.assertTrue(imported)
+        with self.app.app_context():
+            for row in imported:
+                Question.query.get(row['id']).delete()
+
+    def test_import_reports_unknown_category_rows(self):
+        body = 'question,answer,category,difficulty\n' \
+               'Bulk known category?,Known,3,2\n' \
+               'Bulk unknown category?,Unknown,1000,2\n'
+        res = self.client().post('/questions/import', data=body,
+                                 content_type='text/csv')
+        report = json.loads(res.data)['report']
+        self.assertEqual(report['inserted'], 1)
+        self.assertEqual([error['line'] for error in report['errors']], [3])
+        with self.app.app_context():
+            Question.query.filter(
+                Question.question == 'Bulk known category?').delete()
+            self.db.session.commit()
+
+    def test_import_questions_csv(self):
+        body = 'question,answer,category,difficulty\n' \
+               'Bulk csv question?,Csv,3,2\n'
+        res = self.client().post('/questions/import', data=body,
+                                 content_type='text/csv')
+        report = json.loads(res.data)['report']
+        self.assertEqual(report['inserted'], 1)
+        with self.app.app_context():
+            Question.query.filter(
+                Question.question == 'Bulk csv question?').delete()
+            self.db.session.commit()
+
     # Test /category/<int:category_id>/questions endpoint
     def test_question_search_by_category(self):
         res = self.client().get('/categories/1/questions')
@@ -104,10 +259,32 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['questions'])
 
+    def test_question_search_by_category_counts_category(self):
+        res = self.client().get('/categories/1/questions')
+        data = json.loads(res.data)
+        self.assertTrue(all(question['category'] == 1
+                            for question in data['questions']))
+        counts = json.loads(self.client().get(
+            '/categories?with_counts=1').data)['question_counts']
+        self.assertEqual(data['total_questions'], counts['1'])
+
+    def test_get_categories_with_counts(self):
+        res = self.client().get('/categories?with_counts=1')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['question_counts']),
+                         data['total_categories'])
+
     def test_404_question_search_by_invalid_category(self):
         res = self.client().post('category/1000/questions')
         self.assertEqual(res.status_code, 404)
 
+    def test_404_questions_of_unknown_category(self):
+        res = self.client().get('/categories/1000/questions')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
     # Test /quizzes endpoints
     def test_quiz_render_by_category(self):
         res = self.client().post('/quizzes', json={'previous_questions': [],
@@ -122,6 +299,117 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(res.status_code, 422)
 
 
+    def test_quiz_does_not_repeat_questions(self):
+        pool = QuestionPool()
+        pool.load([(1, 1, 1), (2, 1, 2), (3, 1, 3), (4, 2, 1)])
+        self.assertEqual(pool.pick(1, {1, 3}), 2)
+        self.assertIsNone(pool.pick(1, {1, 2, 3}))
+        self.assertEqual(pool.pick(0, {1, 2, 3}), 4)
+        pool.remove(2)
+        self.assertIsNone(pool.pick(1, {1, 3}))
+
+    def test_quiz_pick_near_difficulty(self):
+        pool = QuestionPool()
+        pool.load([(1, 1, 1), (2, 1, 3), (3, 1, 5), (4, 2, 3)])
+        self.assertEqual(pool.pick_near(1, 3), 2)
+        self.assertEqual(pool.pick_near(1, 3, {2}), 1)
+        self.assertEqual(pool.pick_near(0, 3, {2}), 4)
+        pool.add(5, 1, 4)
+        self.assertEqual(pool.pick_near(1, 4), 5)
+        pool.remove(5, 1, 4)
+        self.assertEqual(pool.pick_near(1, 4, {2}), 3)
+        self.assertIsNone(pool.pick_near(1, 3, {1, 2, 3}))
+
+    def test_quiz_pool_tops_up_after_ttl(self):
+        # stands in for questions written by another process
+        pool = QuestionPool(ttl=0)
+        pool.load([])
+        self.assertEqual(pool.size(0), Question.query.count())
+
+    def test_quiz_pool_top_up_adds_new_rows_only(self):
+        pool = QuestionPool(ttl=None)
+        pool.load([(1, 1, 1), (2, 1, 2)])
+        pool.top_up([(2, 1, 2), (7, 2, 3)])
+        self.assertEqual(pool.size(0), 3)
+        self.assertEqual(pool.max_id, 7)
+        self.assertEqual(pool.pick_near(2, 3), 7)
+
+    def test_quiz_session_keeps_only_asked_ids(self):
+        pool = QuestionPool(ttl=None)
+        pool.load([(id, 1, 1) for id in range(1, 1001)])
+        session = QuizSession(1)
+        asked = [session.next_id(pool) for _ in range(3)]
+        self.assertEqual(session.asked, set(asked))
+        self.assertEqual(session.state(pool), {'remaining': 997})
+
+    def test_adaptive_session_follows_accuracy(self):
+        session = AdaptiveQuizSession(1, difficulty=3)
+        for _ in range(ADAPT_WINDOW):
+            session.record(True)
+        self.assertEqual(session.difficulty, 4)
+        for _ in range(ADAPT_WINDOW):
+            session.record(False)
+        self.assertEqual(session.difficulty, 3)
+        for correct in (True, False) * (ADAPT_WINDOW // 2):
+            session.record(correct)
+        self.assertEqual(session.difficulty, 3)
+
+    def test_quiz_end_of_category(self):
+        first = json.loads(self.client().get('/categories/1/questions').data)
+        played = [question['id'] for question in first['questions']]
+        res = self.client().post('/quizzes', json={'previous_questions': played,
+                                                   'quiz_category': {'id': 1}})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNone(data['question'])
+
+    # Test /quizzes/sessions endpoints
+    def test_quiz_session_plays_each_question_once(self):
+        res = self.client().post('/quizzes/sessions',
+                                 json={'quiz_category': {'id': 1}})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+        path = '/quizzes/sessions/{}/next'.format(data['session_id'])
+        seen = []
+        for _ in range(data['total_questions']):
+            question = json.loads(self.client().post(path).data)['question']
+            self.assertEqual(int(question['category']), 1)
+            seen.append(question['id'])
+        self.assertEqual(len(set(seen)), data['total_questions'])
+        last = json.loads(self.client().post(path).data)
+        self.assertIsNone(last['question'])
+
+    def test_adaptive_quiz_session(self):
+        res = self.client().post('/quizzes/sessions', json={
+            'quiz_category': {'id': 0}, 'mode': 'adaptive', 'difficulty': 1})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+        path = '/quizzes/sessions/{}/next'.format(data['session_id'])
+        first = json.loads(self.client().post(path).data)
+        self.assertEqual(first['difficulty'], 1)
+        self.assertEqual(first['question']['difficulty'], 1)
+        seen = {first['question']['id']}
+        for _ in range(ADAPT_WINDOW):
+            data = json.loads(self.client().post(
+                path, json={'correct': True}).data)
+            seen.add(data['question']['id'])
+        self.assertEqual(data['difficulty'], 2)
+        self.assertEqual(data['accuracy'], 1.0)
+        self.assertEqual(len(seen), ADAPT_WINDOW + 1)
+
+    def test_400_quiz_session_next_body_not_object(self):
+        res = self.client().post('/quizzes/sessions',
+                                 json={'quiz_category': {'id': 1}})
+        path = '/quizzes/sessions/{}/next'.format(
+            json.loads(res.data)['session_id'])
+        res = self.client().post(path, json=[True])
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(json.loads(res.data)['success'], False)
+
+    def test_404_quiz_session_unknown(self):
+        res = self.client().post('/quizzes/sessions/nope/next')
+        self.assertEqual(res.status_code, 404)
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
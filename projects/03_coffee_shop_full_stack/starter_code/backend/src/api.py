@@ -1,7 +1,6 @@
 import os
 from flask import Flask, request, jsonify, abort
 from sqlalchemy import exc
-import json
 from flask_cors import CORS
 
 from .database.models import db_drop_and_create_all, setup_db, Drink
@@ -61,7 +60,7 @@ def post_drinks(payload):
         try:
             drink = Drink(
                 title=new_title,
-                recipe=json.dumps(new_recipe)
+                recipe=new_recipe
             )
             drink.insert()
 
@@ -91,7 +90,7 @@ def update_drinks(payload, drink_id):
                 drink.title = body.get('title')
 
             elif 'recipe' in body:
-                drink.recipe = json.dumps(body.get('recipe'))
+                drink.recipe = body.get('recipe')
 
             drink.update()
 
@@ -1,6 +1,8 @@
 import os
-from sqlalchemy import Column, String, Integer
+from sqlalchemy import Column, String, Integer, Float, ForeignKey
+from sqlalchemy.orm import relationship
 from flask_sqlalchemy import SQLAlchemy
+from fsnd_common.db import configure_engine, register_pool_endpoint
 import json
 
 database_filename = "database.db"
@@ -16,8 +18,10 @@ setup_db(app)
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    configure_engine(app)
     db.app = app
     db.init_app(app)
+    register_pool_endpoint(app, db)
 
 '''
 db_drop_and_create_all()
@@ -29,6 +33,38 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+Ingredient
+one line of a drink's recipe, kept in its own table so serializing a drink
+needs no JSON decoding
+'''
+class Ingredient(db.Model):
+    id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
+    drink_id = Column(Integer, ForeignKey('drink.id', ondelete='CASCADE'),
+                      nullable=False, index=True)
+    # order of the ingredient in the recipe, from 0
+    position = Column(Integer, nullable=False)
+    name = Column(String(80), nullable=False)
+    color = Column(String(80), nullable=False)
+    parts = Column(Float, nullable=False)
+
+    '''
+    from_dict(data, position)
+        the Ingredient for a recipe entry {'color', 'name', 'parts'}; raises
+        KeyError or ValueError for an incomplete entry
+    '''
+    @classmethod
+    def from_dict(cls, data, position):
+        return cls(position=position,
+                   name=str(data['name']),
+                   color=str(data['color']),
+                   parts=float(data['parts']))
+
+    def parts_value(self):
+        parts = self.parts
+        return int(parts) if parts == int(parts) else parts
+
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -38,21 +74,56 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
-    # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    # the recipe, one row per ingredient, loaded for every drink of a query
+    # with a single extra SELECT ... WHERE drink_id IN (...)
+    ingredients = relationship(Ingredient, order_by=Ingredient.position,
+                               cascade='all, delete-orphan',
+                               lazy='selectin')
+
+    '''
+    recipe
+        the recipe as [{'color': string, 'name':string, 'parts':number}];
+        assigning a list (or a single entry) replaces the ingredients
+    '''
+    @property
+    def recipe(self):
+        recipe = self.__dict__.get('_recipe')
+        if recipe is None:
+            recipe = [{'color': ingredient.color,
+                       'name': ingredient.name,
+                       'parts': ingredient.parts_value()}
+                      for ingredient in self.ingredients]
+            self._recipe = recipe
+        return recipe
+
+    @recipe.setter
+    def recipe(self, recipe):
+        if isinstance(recipe, dict):
+            recipe = [recipe]
+        if not recipe:
+            raise ValueError('a drink needs at least one ingredient')
+        self.ingredients = [Ingredient.from_dict(entry, position)
+                            for position, entry in enumerate(recipe)]
+        self._recipe = None
+        self._short_recipe = None
+
+    def short_recipe(self):
+        short_recipe = self.__dict__.get('_short_recipe')
+        if short_recipe is None:
+            short_recipe = [{'color': entry['color'], 'parts': entry['parts']}
+                            for entry in self.recipe]
+            self._short_recipe = short_recipe
+        return short_recipe
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': self.short_recipe()
         }
 
     '''
@@ -63,7 +134,7 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.recipe
         }
 
     '''
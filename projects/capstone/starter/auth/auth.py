@@ -1,113 +1,18 @@
-import json
-from flask import request, _request_ctx_stack
-from functools import wraps
-from jose import jwt
-from urllib.request import urlopen
+from fsnd_common.auth import Auth, AuthError
 
 
 AUTH0_DOMAIN = 'dev-rbwkp4wz.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'localhost:5000'
 
-# AuthError Exception
 '''
-AuthError Exception
-A standardized way to communicate auth failure modes
+auth
+    verifies this API's bearer tokens; the shared implementation lives in
+    fsnd_common.auth
 '''
+auth = Auth(AUTH0_DOMAIN, API_AUDIENCE, algorithms=ALGORITHMS)
 
-
-class AuthError(Exception):
-    def __init__(self, error, status_code):
-        self.error = error
-        self.status_code = status_code
-
-# Auth Header
-
-
-def get_token_auth_header():
-    if 'Authorization' not in request.headers:
-        abort(401)
-    auth_header = request.headers['Authorization']
-    header_parts = request.split(' ')
-
-    if len(header_parts) != 2:
-        abort(401)
-    elif header_parts[0].lower() != 'bearer':
-        abort(401)
-    return header_parts[1]
-
-
-def check_permissions(permission, payload):
-    if 'permissions' not in payload:
-        raise AuthError({
-                    'code': 'invalid_claims',
-                    'description': 'Permissions not included in JWT.'
-                        }, 400)
-
-    if permission not in payload['permissions']:
-        raise AuthError({
-            'code': 'unauthorized',
-            'description': 'Permission not found.'
-        }, 403)
-    return True
-
-
-'''
-@TODO implement verify_decode_jwt(token) method
-    @INPUTS
-        token: a json web token (string)
-    it should be an Auth0 token with key id (kid)
-    it should verify the token using Auth0 /.well-known/jwks.json
-    it should decode the payload from the token
-    it should validate the claims
-    return the decoded payload
-'''
-
-
-def verify_decode_jwt(token):
-    jsonurl = urlopen("https://"+AUTH0_DOMAIN+"/.well-known/jwks.json")
-    jwks = json.loads(jsonurl.read())
-    unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
-    for key in jwks["keys"]:
-        if key["kid"] == unverified_header["kid"]:
-            rsa_key = {
-                "kty": key["kty"],
-                "kid": key["kid"],
-                "use": key["use"],
-                "n": key["n"],
-                "e": key["e"]
-            }
-    if rsa_key:
-        try:
-            payload = jwt.decode(
-                    token,
-                    rsa_key,
-                    algorithms=ALGORITHMS,
-                    audience=API_AUDIENCE,
-                    issuer="https://"+AUTH0_DOMAIN+"/"
-                )
-        except jwt.ExpiredSignatureError:
-            raise AuthError({"code": "token_expired",
-                             "description": "token is expired"}, 401)
-        except jwt.JWTClaimsError:
-            raise AuthError({"code": "invalid_claims",
-                            "description": "incorrect claims, \
-                             please check the audience and issuer"}, 401)
-        except Exception:
-            raise AuthError({"code": "invalid_header",
-                             "description": "Unable to parse authentication"},
-                              401)   
-    return payload
-
-
-def requires_auth(permission=''):
-    def requires_auth_decorator(f):
-        @wraps(f)
-        def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
-            return f(payload, *args, **kwargs)
-        return wrapper
-    return requires_auth_decorator
\ No newline at end of file
+get_token_auth_header = auth.get_token_auth_header
+verify_decode_jwt = auth.verify_decode_jwt
+check_permissions = auth.check_permissions
+requires_auth = auth.requires_auth
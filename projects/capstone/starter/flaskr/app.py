@@ -14,7 +14,7 @@ def create_app(test_config=None):
 
   @app.route('/actors', methods=['GET'])
   @requires_auth('get:actors')
-  def get_actors():
+  def get_actors(payload):
     actors = Actors.query.all()
     list_of_actors = []
     for actor in actors:
@@ -24,7 +24,7 @@ def create_app(test_config=None):
 
   @app.route('/actors', methods = ['POST'])
   @requires_auth('post:actors')  
-  def add_actor():
+  def add_actor(payload):
     data = request.get_json()
     new_name = data.get('name', None)
     new_age = data.get('age', None)
@@ -37,7 +37,7 @@ def create_app(test_config=None):
 
   @app.route('/movies', methods=['GET'])
   @requires_auth('get:movies')
-  def get_movies():
+  def get_movies(payload):
     movies = Movies.query.all()
     list_of_movies = []
     for movie in movies:
@@ -48,7 +48,7 @@ def create_app(test_config=None):
 
   @app.route('/movies', methods=['POST'])
   @requires_auth('post:movies')  
-  def add_movie():
+  def add_movie(payload):
     data = request.get_json()
     new_title = data.get('title', None)
     new_release_date = data.get('release_date', None)
@@ -61,7 +61,7 @@ def create_app(test_config=None):
 
   @app.route('/actors/<int:actor_id>', methods = ['DELETE'])
   @requires_auth('delete:actor')  
-  def del_actor(actor_id):
+  def del_actor(payload, actor_id):
     data = request.get_json()
     actor_id = data.get('actor_id', None)
     try:
@@ -77,7 +77,7 @@ def create_app(test_config=None):
 
   @app.route('/movies/<int:movie_id>', methods=['DELETE'])
   @requires_auth('delete:movie')  
-  def del_movie(movie_id):
+  def del_movie(payload, movie_id):
     data = request.get_json()
     movie_id = data.get('movie_id', None)
     try:
@@ -92,7 +92,7 @@ def create_app(test_config=None):
 
   @app.route('/actors/<int:actor_id>', methods=['PATCH'])
   @requires_auth('patch:actor')
-  def update_actor(actor_id):
+  def update_actor(payload, actor_id):
     data = request.get_json()
     try:
       actor = Actors.query.filter(Actors.actor_id == actor_id).one_or_none()
@@ -113,7 +113,7 @@ def create_app(test_config=None):
 
   @app.route('/movies/<int:movie_id>', methods=['PATCH'])
   @requires_auth('patch:movie')
-  def update_movie(movie_id):
+  def update_movie(payload, movie_id):
     data = request.get_json()
     try:
       movie = Movies.query.filter(Movies.movie_id == movie_id).one_or_none()
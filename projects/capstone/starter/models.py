@@ -1,6 +1,7 @@
 import os
 from sqlalchemy import Column, String, create_engine, Integer, DateTime
 from flask_sqlalchemy import SQLAlchemy
+from fsnd_common.db import configure_engine, register_pool_endpoint
 import json
 
 database_name = "capstone_fsnd"
@@ -15,8 +16,10 @@ setup_db(app)
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    configure_engine(app)
     db.app = app
     db.init_app(app)
+    register_pool_endpoint(app, db)
     db.create_all()
 
 
@@ -0,0 +1,10 @@
+from setuptools import setup, find_packages
+
+setup(
+    name='fsnd-common',
+    version='0.1.0',
+    description='Code shared by the Full Stack Nanodegree Flask apps',
+    packages=find_packages(include=['fsnd_common', 'fsnd_common.*']),
+    install_requires=['Flask', 'SQLAlchemy'],
+    extras_require={'auth': ['python-jose-cryptodome']},
+)
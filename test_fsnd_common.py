@@ -0,0 +1,242 @@
+"""
+Tests for the fsnd_common package, runnable without any of the apps'
+databases:
+
+    python -m unittest test_fsnd_common
+"""
+import base64
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from Crypto.PublicKey import RSA
+from flask import Flask
+from jose import jwt
+
+from fsnd_common.auth import Auth, AuthError, VerifiedPayload
+from fsnd_common.db import register_pool_endpoint
+from fsnd_common.jwks import JWKSKeyStore
+from fsnd_common.local_issuer import LocalIssuer
+from fsnd_common.token_cache import VerifiedTokenCache
+
+
+def b64_int(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def write_jwks(test, key, kid='test-key'):
+    """Publishes the public half of key in a temporary JWKS file"""
+    jwks = {'keys': [{'kty': 'RSA', 'kid': kid, 'use': 'sig',
+                      'n': b64_int(key.n), 'e': b64_int(key.e)}]}
+    jwks_file = tempfile.NamedTemporaryFile('w', suffix='.json',
+                                            delete=False)
+    with jwks_file:
+        json.dump(jwks, jwks_file)
+    test.addCleanup(os.remove, jwks_file.name)
+    return jwks_file.name
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+    """The JWKS cache, read from a local file"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.key = RSA.generate(2048)
+
+    def setUp(self):
+        self.store = JWKSKeyStore(path=write_jwks(self, self.key),
+                                  background=False)
+        self.fetches = 0
+        fetch = self.store.fetch
+
+        def counting_fetch():
+            self.fetches += 1
+            return fetch()
+        self.store.fetch = counting_fetch
+
+    def test_verifies_with_cached_key(self):
+        token = jwt.encode({'aud': 'test'}, self.key.exportKey('PEM'),
+                           algorithm='RS256', headers={'kid': 'test-key'})
+        for _ in range(3):
+            payload = jwt.decode(token, self.store.get('test-key'),
+                                 algorithms=['RS256'], audience='test')
+        self.assertEqual(payload['aud'], 'test')
+        self.assertEqual(self.fetches, 1)
+
+    def test_unknown_kid_refetches_once(self):
+        self.store.get('test-key')
+        self.assertIsNone(self.store.get('rotated-key'))
+        self.assertIsNone(self.store.get('rotated-key'))
+        self.assertEqual(self.fetches, 2)
+
+    def test_unknown_kids_share_one_refetch_interval(self):
+        self.store.get('test-key')
+        for kid in ('made-up-1', 'made-up-2', 'made-up-3'):
+            self.assertIsNone(self.store.get(kid))
+        self.assertEqual(self.fetches, 2)
+
+    def test_refreshes_early_without_blocking_requests(self):
+        self.store.get('test-key')
+        # due for the background refresh, but not yet expired
+        self.store.refresh_at = time.time() - 1
+        self.assertTrue(self.store.get('test-key'))
+        self.assertEqual(self.fetches, 1)
+        self.store.refresh(force=False)
+        self.assertEqual(self.fetches, 2)
+        self.assertLess(self.store.refresh_at, self.store.expires)
+
+
+class VerifiedTokenCacheTestCase(unittest.TestCase):
+    """The cache of verified token payloads"""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.cache = VerifiedTokenCache(maxsize=2, clock=lambda: self.now)
+
+    def test_expires_at_exp(self):
+        self.cache.put('token', {'sub': 'a', 'exp': 1010})
+        self.assertEqual(self.cache.get('token')['sub'], 'a')
+        self.now = 1010.0
+        self.assertIsNone(self.cache.get('token'))
+
+    def test_bounded(self):
+        for token in ('a', 'b', 'c'):
+            self.cache.put(token, {'exp': 2000})
+        self.assertIsNone(self.cache.get('a'))
+        self.assertTrue(self.cache.get('c'))
+
+    def test_revoke(self):
+        self.cache.put('token', {'exp': 1010})
+        self.cache.revoke('token')
+        self.assertTrue(self.cache.is_revoked('token'))
+        self.assertIsNone(self.cache.get('token'))
+        self.cache.put('token', {'exp': 1010})
+        self.assertIsNone(self.cache.get('token'))
+        self.now = 1010.0
+        self.assertFalse(self.cache.is_revoked('token'))
+
+
+class SharedAuthTestCase(unittest.TestCase):
+    """fsnd_common.auth against tokens signed with a test key"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.key = RSA.generate(2048)
+
+    def setUp(self):
+        jwks = JWKSKeyStore(path=write_jwks(self, self.key), background=False)
+        self.auth = Auth('test.local', 'test', jwks=jwks)
+        self.app = Flask(__name__)
+
+    def token(self, permissions):
+        claims = {'iss': 'https://test.local/', 'aud': 'test',
+                  'exp': int(time.time()) + 60, 'permissions': permissions}
+        return jwt.encode(claims, self.key.exportKey('PEM'),
+                          algorithm='RS256', headers={'kid': 'test-key'})
+
+    def call(self, decorator, token):
+        view = decorator(lambda payload: payload)
+        headers = {'Authorization': 'Bearer ' + token}
+        with self.app.test_request_context(headers=headers):
+            return view()
+
+    def assertAuthError(self, status_code, decorator, token):
+        with self.assertRaises(AuthError) as raised:
+            self.call(decorator, token)
+        self.assertEqual(raised.exception.status_code, status_code)
+
+    def test_payload_permissions(self):
+        payload = self.call(self.auth.requires_auth('get:actors'),
+                            self.token(['get:actors', 'get:movies']))
+        self.assertIsInstance(payload, VerifiedPayload)
+        self.assertEqual(payload.permissions,
+                         frozenset(['get:actors', 'get:movies']))
+
+    def test_requires_all(self):
+        token = self.token(['get:actors'])
+        requires = self.auth.requires_auth('get:actors', 'post:actors')
+        self.assertAuthError(403, requires, token)
+        self.call(self.auth.requires_auth('get:actors'), token)
+
+    def test_requires_any(self):
+        requires = self.auth.requires_auth('post:actors', 'get:actors',
+                                           require='any')
+        self.call(requires, self.token(['get:actors']))
+        self.assertAuthError(403, requires, self.token(['get:movies']))
+
+    def test_rejects_bad_and_revoked_tokens(self):
+        requires = self.auth.requires_auth()
+        self.assertAuthError(401, requires, 'not-a-token')
+        token = self.token([])
+        self.call(requires, token)
+        self.auth.revoke(token)
+        self.assertAuthError(401, requires, token)
+
+
+class LocalIssuerTestCase(unittest.TestCase):
+    """Tokens minted offline, accepted with AUTH_ISSUER=local"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.key_path = os.path.join(directory, 'issuer.pem')
+        environ = {'AUTH_ISSUER': 'local', 'LOCAL_ISSUER_KEY': self.key_path}
+        saved = dict((name, os.environ.get(name)) for name in environ)
+        os.environ.update(environ)
+        self.addCleanup(self.restore_environ, saved)
+
+    def restore_environ(self, saved):
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    def test_auth_accepts_local_tokens(self):
+        auth = Auth('unused.auth0.com', 'localhost:5000')
+        issuer = LocalIssuer.load_or_create()
+        self.assertEqual(auth.issuer, issuer.issuer)
+        token = issuer.mint('localhost:5000', ['get:actors'])
+        payload = auth.verify_decode_jwt(token)
+        self.assertEqual(payload.permissions, frozenset(['get:actors']))
+        with self.assertRaises(AuthError):
+            auth.verify_decode_jwt(issuer.mint('elsewhere', ['get:actors']))
+
+    def test_key_is_reused(self):
+        first = LocalIssuer.load_or_create()
+        self.assertEqual(LocalIssuer.load_or_create().kid, first.kid)
+
+    def test_refuses_key_open_to_other_users(self):
+        LocalIssuer.load_or_create()
+        os.chmod(self.key_path, 0o644)
+        with self.assertRaises(RuntimeError):
+            LocalIssuer.load_or_create()
+        os.chmod(self.key_path, 0o600)
+        os.chmod(os.path.dirname(self.key_path), 0o777)
+        self.addCleanup(os.chmod, os.path.dirname(self.key_path), 0o700)
+        with self.assertRaises(RuntimeError):
+            LocalIssuer.load_or_create()
+
+
+
+class PoolEndpointTestCase(unittest.TestCase):
+    """The unauthenticated /_pool route is opt-in"""
+
+    def test_off_by_default(self):
+        app = Flask(__name__)
+        register_pool_endpoint(app, None)
+        self.assertNotIn('pool_stats', app.view_functions)
+
+    def test_on_with_flag(self):
+        app = Flask(__name__)
+        app.config['DB_POOL_ENDPOINT'] = True
+        register_pool_endpoint(app, None)
+        self.assertIn('pool_stats', app.view_functions)
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()